@@ -1,14 +1,22 @@
 from pathlib import Path
-import re  
-from flask import Flask, request, jsonify
+import click
+from flask import Flask, request, jsonify, abort, g, stream_with_context
+from werkzeug.exceptions import HTTPException
 import pandas as pd
 import numpy as np
-from sklearn.model_selection import train_test_split
-from sklearn.preprocessing import OneHotEncoder
-from sklearn.compose import ColumnTransformer
-from sklearn.pipeline import Pipeline
-from sklearn.linear_model import LogisticRegression
-from sklearn.metrics import confusion_matrix, accuracy_score
+
+import artifacts
+import bootstrap
+import instrument
+import jobs
+import optimize
+from fairness import METRICS, confusion_counts, gap, leave_one_out_gap, metric_from_counts
+from cache import ResponseCache, cached_response
+from groups import ProtectedKeyError
+from instrument import phase
+from registry import Registry
+from neutralize import neutralized_counts
+from slices import worst_slices
 
 CSV_PATH = Path("german_credit_with_split.csv")
 TARGET_COLUMN = "CreditRisk"
@@ -19,125 +27,147 @@ PROTECTED_ATTRS = {
     "age"           : "Age"
 }
 
-app = Flask(__name__, static_folder="static")
-df = pd.read_csv(CSV_PATH)
+# split + LogisticRegression settings; part of the artifact key
+MODEL_PARAMS = {
+    "test_size"   : 0.3,
+    "random_state": 42,
+    "max_iter"    : 300,
+    "solver"      : "liblinear",
+    "class_weight": "balanced",
+}
 
-# ---- 2. TRAIN / PREDICT ----------------------------------
-y = df[TARGET_COLUMN].map({2:0, 1:1}) 
-X = df.drop(columns=[TARGET_COLUMN])
+# extra datasets/models: {"name": {"csv", "target", "protected", "models": {name: params}}}
+DATASETS_CONFIG = Path("datasets.json")
+# loaded (dataset, model) entries beyond this are evicted, least recently used first
+REGISTRY_MEMORY_BUDGET = 2 * 2**30
 
-cat_cols = X.select_dtypes(include="object").columns.tolist()
+# upper bound on ?n_boot= for bootstrap intervals on /metric_gap
+MAX_BOOTSTRAP = 100_000
 
-prep = ColumnTransformer(
-    transformers=[("cat", OneHotEncoder(handle_unknown="ignore"), cat_cols)],
-    remainder="passthrough"
-)
+# protected cells with fewer rows than this are dropped (?min_support= overrides,
+# ?small=merge pools them into one "Other" cell instead)
+MIN_SUPPORT = 0
 
-clf = Pipeline([
-    ("prep", prep),
-    ("logreg", LogisticRegression(max_iter=300, solver="liblinear", class_weight="balanced"))
-])
+# deepest conjunction /worst_slices will search
+MAX_SLICE_DEPTH = 3
 
-X_train, X_test, y_train, y_test = train_test_split(
-    X, y, test_size=0.3, stratify=y, random_state=42
-)
+# /snapshot panels, in the order they are computed / streamed (cheapest first)
+SNAPSHOT_PANELS = ("gap", "groups", "sankey", "heatmaps")
 
-# Reset indices to avoid misalignment
-X_train.reset_index(drop=True, inplace=True)
-X_test.reset_index(drop=True, inplace=True)
-y_train.reset_index(drop=True, inplace=True)
-y_test.reset_index(drop=True, inplace=True)
+# candidate thresholds per group for /optimize_thresholds (?max_points= overrides)
+OPTIMIZER_POINTS = 200
 
-clf.fit(X_train, y_train)
-y_pred = clf.predict(X_test)
-y_prob = clf.predict_proba(X_test)[:, 1]
+# response cache budget for the analytic endpoints
+CACHE_MAX_ENTRIES = 512
+CACHE_MAX_BYTES   = 256 * 2**20
 
-# For app use
-proba_test = y_prob
+# per-phase Server-Timing headers and /metrics counters (False = no-op hooks)
+INSTRUMENTATION = True
 
-# Debug log for validation
-print("Confusion matrix:")
-print(confusion_matrix(y_test, y_pred))
-print("Accuracy:", round(accuracy_score(y_test, y_pred), 4))
+# worker processes for background retrain jobs (POST /retrain)
+RETRAIN_WORKERS = 1
 
-def bucket_age(series):
-    bins = [0, 30, series.max() + 1]
-    labels = ["<30", "≥30"]
-    return pd.cut(series, bins=bins, labels=labels, right=False)
+app = Flask(__name__, static_folder="static")
+instrument.init_app(app, INSTRUMENTATION)
+RESPONSE_CACHE = ResponseCache(CACHE_MAX_ENTRIES, CACHE_MAX_BYTES)
+# ---- 2. TRAIN / PREDICT ----------------------------------
+# Each (dataset, model) is trained once per (CSV contents, params) and persisted
+# under artifacts/; the registry memory-maps it on first use.
+def _log_validation(ev):
+    _, sweep = ev.sweep_for([])
+    tp, fp, tn, fn = (int(c[0]) for c in sweep.counts(0.5))
+    print(f"[{ev.dataset}/{ev.model}] Confusion matrix:")
+    print(np.array([[tn, fp], [fn, tp]]))
+    print("Accuracy:", round((tp + tn) / (tp + fp + tn + fn), 4))
+
+REGISTRY = Registry(REGISTRY_MEMORY_BUDGET, on_load=_log_validation)
+REGISTRY.register("german_credit", CSV_PATH, TARGET_COLUMN, PROTECTED_ATTRS, {"logreg": MODEL_PARAMS})
+if DATASETS_CONFIG.exists():
+    REGISTRY.load_config(DATASETS_CONFIG)
+
+
+def current():
+    """
+    ModelEntry named by the request's ?dataset=&model= (defaults if absent).
+    Resolved once per request, so a retrain swapping the model mid-request
+    can't mix two versions in one response.
+    """
+    if "entry" in g:
+        return g.entry
+    try:
+        with phase("load"):
+            ev = REGISTRY.get(request.args.get("dataset"), request.args.get("model"))
+    except KeyError as e:
+        abort(404, description=e.args[0])
+    instrument.note_rows(ev.n_rows)
+    g.entry = ev
+    return ev
 
-def confusion_by_mask(mask, thr):
-    if mask.sum() == 0:
-        return dict(TP=0, FP=0, TN=0, FN=0)
 
-    idx = mask.values            #  ← NEW  (pure boolean array)
+def _cache_scope():
+    return (current().version,)
 
-    y_true = y_test[idx].values
-    y_pred_bin = (y_prob[idx] >= thr).astype(int)  # ← use idx
 
-    tn, fp, fn, tp = confusion_matrix(
-        y_true, y_pred_bin, labels=[0, 1]
-    ).ravel()
+def _support():
+    """(min_support, merge) for GroupIndex.grouping from ?min_support=&small=, or None."""
+    n = request.args.get("min_support", MIN_SUPPORT, type=int)
+    return (n, request.args.get("small") == "merge") if n > 0 else None
 
-    return dict(TP=int(tp), FP=int(fp), TN=int(tn), FN=int(fn))
 
-def _as_cat(series: pd.Series) -> pd.Series:
-    """Return a tidy, categorical string version suitable for the Sankey."""
-    name = series.name.lower()
+def confusion_by_mask(ev, mask, thr):
+    idx = np.asarray(mask, dtype=bool)
+    tp, fp, tn, fn = confusion_counts(np.zeros(int(idx.sum()), dtype=np.int64), 1,
+                                      ev.y_test.values[idx], (ev.y_prob[idx] >= thr).astype(int))
+    return dict(TP=int(tp[0]), FP=int(fp[0]), TN=int(tn[0]), FN=int(fn[0]))
 
-    # numeric Age → buckets <30, 30–49, 50+
-    if name == "age" and pd.api.types.is_numeric_dtype(series):
-        return bucket_age(series).astype(str)
 
-    # normalise capitalisation for consistency
-    if name == "gender":
-        return series.str.capitalize()         # male → Male
-    if name == "marital_status":
-        return series.str.title()              # single → Single
+# ------------------------------------------------------------------ #
+#  Fairness‑gap helpers used by LOGO                                  #
+# ------------------------------------------------------------------ #
+def logo_groups(ev, metric, thr, protected_cols, support=None):
+    """
+    Leave-one-group-out: per group, its metric, the gap across the other
+    groups and the overall metric without its rows (totals − its counts).
+    """
+    with phase("groups"):
+        grouping, sweep = ev.sweep_for(protected_cols, support)
+    with phase("counts"):
+        counts = np.stack(sweep.counts(thr))                  # [4, G]
+    values = metric_from_counts(metric, *counts)
+    without = metric_from_counts(metric, *(counts.sum(axis=1, keepdims=True) - counts))
+    return grouping, values, leave_one_out_gap(values), without
 
-    # fall-back
-    return series.astype(str)
 
+def logo_feature(ev, metric, thr, protected_cols, feature, bins, support=None):
+    """
+    Leave-one-value-out for a feature (numeric features binned as in /heatmap):
+    per value, its row count and the gap across groups once its rows are
+    subtracted from every group's counts.
+    """
+    with phase("groups"):
+        _, sweep = ev.sweep_for(protected_cols, support)
+    with phase("bin"):
+        _, flabels, *cells = ev.heatmap_cells(feature, bins, protected_cols, thr, support)
+    cells  = np.stack(cells)                                  # [4, G, F]
+    totals = np.stack(sweep.counts(thr))[:, :, None]          # [4, G, 1]
+    values = metric_from_counts(metric, *(totals - cells))    # [G, F]
+    return flabels, cells.sum(axis=(0, 1)), gap(values, axis=0)
 
+def invalidate_caches():
+    """Forget every cached response (entries are also scoped by artifact version)."""
+    RESPONSE_CACHE.clear()
 
-# ------------------------------------------------------------------ #
-#  Fairness‑gap helper used by LOGO                                   #
-# ------------------------------------------------------------------ #
-def _gap_for_df(df_eval: pd.DataFrame, metric: str) -> float:
-    """Return max–min disparity of `metric` across the groups in *df_eval*."""
-    def ratio(sub):
-        tp = ((sub["gt"] == 1) & (sub["pred"] == 1)).sum() 
-        fp = ((sub["gt"] == 0) & (sub["pred"] == 1)).sum() 
-        tn = ((sub["gt"] == 0) & (sub["pred"] == 0)).sum() 
-        fn = ((sub["gt"] == 1) & (sub["pred"] == 0)).sum()
-
-        if metric == "demographic_parity":       return (tp+fp)/(tp+fp+tn+fn) if (tp+fp+tn+fn) else np.nan
-        if metric == "equal_opportunity":        return tp/(tp+fn)            if (tp+fn)       else np.nan
-        if metric == "predictive_parity":        return tp/(tp+fp)            if (tp+fp)       else np.nan
-        if metric == "predictive_equality":      return fp/(fp+tn)            if (fp+tn)       else np.nan
-        if metric == "treatment_equality":       return fn/fp                 if fp            else np.nan
-        if metric == "equalized_odds":
-            tpr = tp/(tp+fn) if (tp+fn) else np.nan
-            fpr = fp/(fp+tn) if (fp+tn) else np.nan
-            return abs(tpr-fpr) if not (np.isnan(tpr)|np.isnan(fpr)) else np.nan
-        return np.nan
-
-    vals = (df_eval
-            .groupby("group", dropna=False)
-            .apply(ratio)
-            .dropna()
-            .values)
-    return 0.0 if len(vals) < 2 else float(np.nanmax(vals) - np.nanmin(vals))
-
-def ordered_age_labels(series):
-    """Return the distinct age-bucket strings sorted by their
-       numeric lower-bound (e.g. '<30', '30–49', '50+')."""
-    def key(label):
-        # pull first number in the string; '<30' → 0, '30–49' → 30, '50+' → 50
-        m = re.search(r"\d+", label)
-        return int(m.group()) if m else 0
-    return sorted(series.unique(), key=key)
-
-def build_sankey_json(protected_cols, thr, metric):
+
+JOBS = jobs.JobManager(REGISTRY, RETRAIN_WORKERS, on_swap=invalidate_caches)
+
+
+@app.before_request
+def sync_retrains():
+    """Pick up models another serve.py worker retrained (jobs.JobManager.sync)."""
+    JOBS.sync()
+
+
+def build_sankey_json(ev, protected_cols, thr, metric, support=None):
     """
     3-layer Sankey:
         L0: GT+ , GT−
@@ -145,9 +175,11 @@ def build_sankey_json(protected_cols, thr, metric):
         L2: TP / FP / TN / FN
     Node sizes: counts. Group→Outcome link tooltip uses within-group share.
     """
-    df_eval = X_test.copy()
-    df_eval["gt"]   = y_test.values
-    df_eval["pred"] = (y_prob >= thr).astype(int)
+    with phase("groups"):
+        grouping, sweep = ev.sweep_for(protected_cols, support)
+    labels = grouping.labels
+    with phase("counts"):
+        tp, fp, tn, fn = (c.tolist() for c in sweep.counts(thr))
 
     node_map, nodes, links = {}, [], []
 
@@ -161,37 +193,22 @@ def build_sankey_json(protected_cols, thr, metric):
     gt_pos = node_id("GT+")
     gt_neg = node_id("GT-")
 
-    # L1
-    if not protected_cols:
-        df_eval["group"] = "All"
-    else:
-        cols_real = [PROTECTED_ATTRS[c] for c in protected_cols]
-        if len(cols_real) == 1:
-            col = cols_real[0]
-            df_eval["group"] = _as_cat(df_eval[col])
-            if col.lower() == "age":
-                ordered = ordered_age_labels(df_eval["group"])
-                cat_type = pd.CategoricalDtype(categories=ordered, ordered=True)
-                df_eval["group"] = df_eval["group"].astype(cat_type)
-        else:
-            c1, c2 = cols_real
-            df_eval["group"] = _as_cat(df_eval[c1]) + " | " + _as_cat(df_eval[c2])
-
-    group_ids = {g: node_id(g) for g in df_eval["group"].unique()}
+    # L1 (node ids in order of first appearance, links in group order)
+    group_ids = {labels[g]: node_id(labels[g]) for g in grouping.first_seen}
 
     # GT → Group (counts)
-    for g, sub in df_eval.groupby("group"):
-        gid = group_ids[g]
-        pos = int((sub["gt"] == 1).sum())
-        neg = int((sub["gt"] == 0).sum())
+    for g in grouping.order:
+        gid = group_ids[labels[g]]
+        pos = tp[g] + fn[g]
+        neg = fp[g] + tn[g]
         tot = pos + neg or 1
 
         # attach shares on the *group node* (so you can also use them for node fills)
         nodes[gid]["gt_pos_share"] = pos / tot
         nodes[gid]["gt_neg_share"] = neg / tot
 
-        links.append({"source": gt_pos, "target": gid, "value": pos, "value": pos, "share": pos / tot})
-        links.append({"source": gt_neg, "target": gid, "value": neg, "value": neg, "share": neg / tot})
+        links.append({"source": gt_pos, "target": gid, "value": pos, "share": pos / tot})
+        links.append({"source": gt_neg, "target": gid, "value": neg, "share": neg / tot})
 
     # L2 outcome nodes
     out_tp = node_id("TP")
@@ -200,18 +217,14 @@ def build_sankey_json(protected_cols, thr, metric):
     out_fn = node_id("FN")
 
     # Group → Outcome (counts + share, NO derivatives)
-    for g, sub in df_eval.groupby("group"):
-        gid = group_ids[g]
-        tp = ((sub["gt"]==1)&(sub["pred"]==1)).sum()
-        fp = ((sub["gt"]==0)&(sub["pred"]==1)).sum()
-        tn = ((sub["gt"]==0)&(sub["pred"]==0)).sum()
-        fn = ((sub["gt"]==1)&(sub["pred"]==0)).sum()
-        total = tp+fp+tn+fn or 1
-
-        tpr = tp / (tp + fn) if (tp + fn) else None
-        fpr = fp / (fp + tn) if (fp + tn) else None
-        tnr = tn / (tn + fp) if (tn + fp) else None
-        fnr = fn / (fn + tp) if (fn + tp) else None
+    for g in grouping.order:
+        gid = group_ids[labels[g]]
+        total = tp[g] + fp[g] + tn[g] + fn[g] or 1
+
+        tpr = tp[g] / (tp[g] + fn[g]) if (tp[g] + fn[g]) else None
+        fpr = fp[g] / (fp[g] + tn[g]) if (fp[g] + tn[g]) else None
+        tnr = tn[g] / (tn[g] + fp[g]) if (tn[g] + fp[g]) else None
+        fnr = fn[g] / (fn[g] + tp[g]) if (fn[g] + tp[g]) else None
 
         def add(src, tgt, val, extra=None):
             link = {
@@ -222,79 +235,34 @@ def build_sankey_json(protected_cols, thr, metric):
             if extra: link.update(extra)
             links.append(link)
 
-        add(gid, out_tp, tp, {"rate_tpr": None if tpr is None else float(tpr)})
-        add(gid, out_fp, fp, {"rate_fpr": None if fpr is None else float(fpr)})
-        add(gid, out_tn, tn, {"rate_tnr": None if tnr is None else float(tnr)})
-        add(gid, out_fn, fn, {"rate_fnr": None if fnr is None else float(fnr)})
+        add(gid, out_tp, tp[g], {"rate_tpr": tpr})
+        add(gid, out_fp, fp[g], {"rate_fpr": fpr})
+        add(gid, out_tn, tn[g], {"rate_tnr": tnr})
+        add(gid, out_fn, fn[g], {"rate_fnr": fnr})
 
     return {"nodes": nodes, "links": links}
 
 
-def metric_gap(metric: str, thr: float, protected_cols: list[str]) -> float:
+def metric_gap(ev, metric: str, thr: float, protected_cols: list[str], support=None) -> float:
     """
     Compute disparity (max - min) of 'metric' across the chosen protected groups.
-    Supported metrics: equal_opportunity, predictive_parity,
-                       predictive_equality, equalized_odds
+    Supported metrics: see fairness.METRICS
     """
     if not protected_cols:
         return 0.0
 
-    # Resolve real column names
-    col_map = [PROTECTED_ATTRS[c] for c in protected_cols]
-
-    # Slice X_test (already aligned) and add pred / label columns
-    df_eval = X_test[col_map].copy()
-
-    # ── Bucket Age if it is in the slice (so groups are categorical) ──
-    if "Age" in df_eval.columns and pd.api.types.is_numeric_dtype(df_eval["Age"]):
-        df_eval["Age"] = bucket_age(df_eval["Age"])
-
-    df_eval["pred"]  = (y_prob >= thr).astype(int)
-    df_eval["label"] = y_test.values
-
-    # ── Metric definition per group ───────────────────────────────────
-    def ratio(d: pd.DataFrame) -> float:
-        tp = ((d.label == 1) & (d.pred == 1)).sum()
-        fp = ((d.label == 0) & (d.pred == 1)).sum()
-        tn = ((d.label == 0) & (d.pred == 0)).sum()
-        fn = ((d.label == 1) & (d.pred == 0)).sum()
-
-        if metric == "demographic_parity":       
-            total = tp + fp + tn + fn
-            return np.nan if total == 0 else (tp + fp) / total
-
-        if metric == "equal_opportunity":           # True-Positive Rate
-            denom = tp + fn
-            return np.nan if denom == 0 else tp / denom
-
-        if metric == "predictive_parity":           # Precision
-            denom = tp + fp
-            return np.nan if denom == 0 else tp / denom
-
-        if metric == "predictive_equality":         # False-Positive Rate
-            denom = fp + tn
-            return np.nan if denom == 0 else fp / denom
-
-        if metric == "equalized_odds":              # |TPR − FPR|
-            tpr = tp / (tp + fn) if (tp + fn) else np.nan
-            fpr = fp / (fp + tn) if (fp + tn) else np.nan
-            return np.nan if np.isnan(tpr) or np.isnan(fpr) else abs(tpr - fpr)
-        
-        if metric == "treatment_equality":
-            return fn / fp if fp > 0 else np.nan
-
-        return np.nan   # unsupported metric
-
-    # ── Compute ratio per group, drop NaNs, then gap = max − min ─────
-    group_vals = (
-        df_eval
-          .groupby(col_map, dropna=False)
-          .apply(ratio)
-          .dropna()
-          .values
-    )
+    with phase("groups"):
+        _, sweep = ev.sweep_for(protected_cols, support)
+    with phase("counts"):
+        counts = sweep.counts(thr)
+    return gap(metric_from_counts(metric, *counts))
+
 
-    return 0.0 if len(group_vals) == 0 else float(np.nanmax(group_vals) - np.nanmin(group_vals))
+def _json_grid(values):
+    """float ndarray → nested lists with NaN → None (null in JSON)."""
+    out = np.asarray(values, dtype=object)
+    out[np.isnan(np.asarray(values, dtype=float))] = None
+    return out.tolist()
 
 @app.route("/")
 def root():
@@ -308,92 +276,377 @@ def root():
 #     return jsonify(build_sankey_json(cols, thr))
 
 @app.route("/sankey")
+@cached_response(RESPONSE_CACHE, _cache_scope)
 def sankey_route():
-    """Return Sankey JSON + signed‑pull contribution per group node."""
+    """Return Sankey JSON with each group node's metric value."""
     protected = request.args.get("protected", "")
     thr       = float(request.args.get("thr", 0.5))
     metric    = request.args.get("metric", "equal_opportunity")
     cols      = [c.strip() for c in protected.split(",") if c.strip()]
+    return jsonify(sankey_payload(current(), cols, thr, metric, _support()))
 
-    # ---------- 1.  Plain Sankey (nodes + links) ----------------------
-    sankey_json = build_sankey_json(cols, thr, metric)
-
-    # ---------- 2.  Build evaluation frame ---------------------------
-    df_eval = X_test.copy()
-    df_eval["gt"]   = y_test.values
-    df_eval["pred"] = (y_prob >= thr).astype(int)
-
-    if not cols:
-        df_eval["group"] = "All"
-    else:
-        real = [PROTECTED_ATTRS[c] for c in cols]
-        if len(real) == 1:
-            df_eval["group"] = _as_cat(df_eval[real[0]])
-        else:
-            df_eval["group"] = _as_cat(df_eval[real[0]]) + " | " + _as_cat(df_eval[real[1]])
-
-    # ---------- 3.  Signed‑pull contribution -------------------------
-    def metric_ratio(sub):
-        tp = ((sub["gt"]==1)&(sub["pred"]==1)).sum()
-        fp = ((sub["gt"]==0)&(sub["pred"]==1)).sum()
-        tn = ((sub["gt"]==0)&(sub["pred"]==0)).sum()
-        fn = ((sub["gt"]==1)&(sub["pred"]==0)).sum()
-
-        if metric == "demographic_parity":  return (tp+fp)/(tp+fp+tn+fn) if tp+fp+tn+fn else np.nan
-        if metric == "equal_opportunity":   return tp/(tp+fn)            if tp+fn       else np.nan
-        if metric == "predictive_parity":   return tp/(tp+fp)            if tp+fp       else np.nan
-        if metric == "predictive_equality": return fp/(fp+tn)            if fp+tn       else np.nan
-        if metric == "treatment_equality":  return fn/fp                 if fp          else np.nan
-        if metric == "equalized_odds":
-            tpr = tp/(tp+fn) if tp+fn else np.nan
-            fpr = fp/(fp+tn) if fp+tn else np.nan
-            return abs(tpr-fpr) if not (np.isnan(tpr)|np.isnan(fpr)) else np.nan
-        return np.nan
-    
-    
-
-    metric_vals = (
-        df_eval.groupby("group", dropna=False)
-               .apply(metric_ratio)
-               .dropna()
-    )
-    metric_map = metric_vals.to_dict()
-    for n in sankey_json["nodes"]:
-        name = n.get("name")
-        if name in metric_map:
-            n["metric_val"] = float(metric_map[name])
-
-    overall_val = metric_vals.mean()                 # baseline
-    contrib = {}
-    for g, val in metric_vals.items():
-        pop = len(df_eval[df_eval["group"] == g])
-        contrib[g] = (val - overall_val) * pop       # signed pull
 
-    # attach to nodes
+def sankey_payload(ev, cols, thr, metric, support=None):
+    """build_sankey_json with each group node's metric value attached (the /sankey body)."""
+    # ---------- 1.  Plain Sankey (nodes + links) ----------------------
+    sankey_json = build_sankey_json(ev, cols, thr, metric, support)
+
+    # ---------- 2.  Per-group metric from the cached counts -----------
+    with phase("groups"):
+        grouping, sweep = ev.sweep_for(cols, support)
+    labels = grouping.labels
+    with phase("counts"):
+        vals = metric_from_counts(metric, *sweep.counts(thr))
+    defined = ~np.isnan(vals)
+
+    # ---------- 3.  Attach to the group nodes -----------------------
+    metric_map = {labels[g]: float(vals[g]) for g in np.flatnonzero(defined)}
     for n in sankey_json["nodes"]:
-        g = n["name"]
-        if g in metric_vals:
-            n["metric_val"] = float(metric_vals[g])
+        g = n.get("name")
+        if g in metric_map:
+            n["metric_val"] = metric_map[g]
 
-    # ---------- 4.  Return JSON --------------------------------------
-    return jsonify(sankey_json)
+    return sankey_json
 
 
 @app.route("/metric_gap")
+@cached_response(RESPONSE_CACHE, _cache_scope)
 def gap_route():
     metric = request.args.get("metric", "equal_opportunity")
     thr = float(request.args.get("thr", 0.5))
     protected = [c.strip() for c in request.args.get("protected", "").split(",") if c.strip()]
-    g = metric_gap(metric, thr, protected)
-    return jsonify(dict(metric=metric, gap=round(g, 4)))
+    g = metric_gap(current(), metric, thr, protected, _support())
+    if "ci" not in request.args:
+        return jsonify(dict(metric=metric, gap=round(g, 4)))
+
+    # ?ci=0.95[&n_boot=1000&seed=0] – bootstrap intervals for the gap and every group
+    level  = request.args.get("ci", 0.95, type=float)
+    n_boot = request.args.get("n_boot", 1000, type=int)
+    seed   = request.args.get("seed", bootstrap.SEED, type=int)
+    if not 0 < level < 1 or not 0 < n_boot <= MAX_BOOTSTRAP:
+        return jsonify(error=f"need 0 < ci < 1 and 0 < n_boot <= {MAX_BOOTSTRAP}"), 400
+
+    grouping, sweep = current().sweep_for(protected, _support())
+    counts = sweep.counts(thr)
+    with phase("bootstrap"):
+        values, gaps = bootstrap.bootstrap(metric, *counts, n_boot=n_boot, seed=seed)
+        lo, hi = bootstrap.percentile_ci(values, level)
+    point = metric_from_counts(metric, *counts)
+    r = lambda v: None if np.isnan(v) else round(float(v), 4)
+
+    return jsonify(dict(
+        metric = metric,
+        gap    = round(g, 4),
+        ci     = [r(v) for v in bootstrap.percentile_ci(gaps, level)] if protected else [0.0, 0.0],
+        level  = level,
+        n_boot = n_boot,
+        groups = [dict(group=grouping.labels[i], value=r(point[i]), ci=[r(lo[i]), r(hi[i])])
+                  for i in grouping.order],
+    ))
+
+@app.route("/metric_curve")
+@cached_response(RESPONSE_CACHE, _cache_scope)
+def metric_curve_route():
+    """
+    Every fairness metric (per group + gap) at every distinct threshold.
+    The value at thresholds[i] holds for any slider position in
+    (thresholds[i-1], thresholds[i]].
+    Optional: metric=<one metric>, max_points=<thin the threshold list>.
+    """
+    protected  = [c.strip() for c in request.args.get("protected", "").split(",") if c.strip()]
+    metric     = request.args.get("metric")
+    max_points = request.args.get("max_points", type=int)
+
+    if metric and metric not in METRICS:
+        return jsonify(error=f"unknown metric '{metric}'"), 400
+
+    with phase("groups"):
+        grouping, sweep = current().sweep_for(protected, _support())
+    with phase("counts"):
+        thresholds, tp, fp, tn, fn = sweep.curve(max_points=max_points)
+
+    out = {}
+    with phase("metric"):
+        for m in ([metric] if metric else METRICS):
+            vals = metric_from_counts(m, tp, fp, tn, fn)[grouping.order]
+            out[m] = {
+                "values": _json_grid(vals),
+                "gap"   : gap(vals, axis=0).tolist(),
+            }
+
+    return jsonify(
+        thresholds = thresholds.tolist(),
+        groups     = [grouping.labels[g] for g in grouping.order],
+        metrics    = out,
+    )
+
+@app.route("/optimize_thresholds")
+@cached_response(RESPONSE_CACHE, _cache_scope)
+def optimize_thresholds_route():
+    """
+    Thresholds that minimise the metric gap – one per group (mode=per_group,
+    default) or one shared (mode=global) – and the Pareto frontier of
+    accuracy against gap. Optional constraints: min_accuracy, min_selection,
+    max_selection (overall rates). Candidates are thinned to max_points
+    distinct scores; `thr` is the operating point reported as `current`.
+    """
+    metric     = request.args.get("metric", "equal_opportunity")
+    mode       = request.args.get("mode", "per_group")
+    thr        = float(request.args.get("thr", 0.5))
+    protected  = [c.strip() for c in request.args.get("protected", "").split(",") if c.strip()]
+    max_points = request.args.get("max_points", OPTIMIZER_POINTS, type=int)
+    limits     = {k: request.args.get(k, type=float)
+                  for k in ("min_accuracy", "min_selection", "max_selection")}
+
+    if metric not in METRICS:
+        return jsonify(error=f"unknown metric '{metric}'"), 400
+    if mode not in ("per_group", "global"):
+        return jsonify(error=f"unknown mode '{mode}'"), 400
+    if not protected:
+        return jsonify(error="pick at least one protected attribute"), 400
+    if max_points < 2:
+        return jsonify(error="need max_points >= 2"), 400
+
+    with phase("groups"):
+        grouping, sweep = current().sweep_for(protected, _support())
+    with phase("counts"):
+        thresholds, tp, fp, tn, fn = sweep.curve(max_points=max_points)
+        now = np.stack(sweep.counts(thr))                     # [4, G]
+    with phase("search"):
+        choice, values, gaps, acc, sel, frontier, best = optimize.optimize(
+            metric, tp, fp, tn, fn, mode, **limits)
+
+    r = lambda v: None if np.isnan(v) else round(float(v), 4)
+    order = grouping.order
+    total = now.sum() or 1
+    out = dict(
+        metric  = metric,
+        mode    = mode,
+        groups  = [grouping.labels[g] for g in order],
+        current = dict(threshold=thr, gap=r(gap(metric_from_counts(metric, *now))),
+                       accuracy=r((now[0] + now[2]).sum() / total),
+                       selection_rate=r((now[0] + now[1]).sum() / total)),
+        best    = None,
+        frontier = [dict(gap=r(gaps[i]), accuracy=r(acc[i]), selection_rate=r(sel[i]),
+                         thresholds=[r(thresholds[choice[i, g]]) for g in order])
+                    for i in frontier],
+    )
+    if best is not None:
+        out["best"] = dict(
+            gap=r(gaps[best]), accuracy=r(acc[best]), selection_rate=r(sel[best]),
+            thresholds=[dict(group=grouping.labels[g], threshold=r(thresholds[choice[best, g]]),
+                             value=r(values[best, g]))
+                        for g in order])
+    return jsonify(out)
+
+@app.route("/neutralize_ranking")
+@cached_response(RESPONSE_CACHE, _cache_scope)
+def neutralize_ranking_route():
+    """
+    What-if for every feature at once: the metric gap across the protected
+    groups before, and after neutralizing each feature on its own.
+    Features come back sorted by gap after neutralization (most improved first).
+    """
+    metric    = request.args.get("metric", "equal_opportunity")
+    thr       = float(request.args.get("thr", 0.5))
+    protected = [c.strip() for c in request.args.get("protected", "").split(",") if c.strip()]
+
+    if metric not in METRICS:
+        return jsonify(error=f"unknown metric '{metric}'"), 400
+    ev = current()
+    if ev.streaming:
+        return jsonify(error="neutralization is not available for streamed datasets"), 400
+    if not protected:
+        return jsonify(error="pick at least one protected attribute"), 400
+
+    with phase("groups"):
+        grouping = ev.groups.grouping(protected, _support())
+    sources  = {ev.protected_attrs[k] for k in protected}
+    features = [f for f in ev.feature_names if f not in sources]
+    numeric  = ev.X_test.select_dtypes(include=[np.number]).columns
+
+    before = metric_gap(ev, metric, thr, protected, _support())
+    with phase("neutralize"):
+        counts = neutralized_counts(ev.rescorer, features, numeric, grouping.codes,
+                                    grouping.n_groups, ev.y_test.values, thr)
+    after  = gap(metric_from_counts(metric, *counts.transpose(1, 0, 2)), axis=1)
+
+    ranked = sorted(zip(features, after.tolist()), key=lambda fa: fa[1])
+    return jsonify(
+        metric   = metric,
+        gap      = round(before, 4),
+        features = [dict(feature=f, gap=round(a, 4), delta=round(a - before, 4))
+                    for f, a in ranked],
+    )
+
+@app.route("/logo")
+@cached_response(RESPONSE_CACHE, _cache_scope)
+def logo_route():
+    """
+    Leave-one-group-out attribution of the gap: how it moves when each
+    protected group (and, with feature=, each value/bin of that feature)
+    is removed. Everything comes from subtracting confusion counts.
+    """
+    metric    = request.args.get("metric", "equal_opportunity")
+    thr       = float(request.args.get("thr", 0.5))
+    protected = [c.strip() for c in request.args.get("protected", "").split(",") if c.strip()]
+    feature   = request.args.get("feature")
+    bins      = int(request.args.get("bins", 6))
+
+    if metric not in METRICS:
+        return jsonify(error=f"unknown metric '{metric}'"), 400
+    ev = current()
+    if feature and feature not in ev.feature_names:
+        return jsonify(error=f"feature '{feature}' not found"), 400
+
+    r = lambda v: None if np.isnan(v) else round(float(v), 4)
+    base = metric_gap(ev, metric, thr, protected, _support())
+    grouping, values, gaps, without = logo_groups(ev, metric, thr, protected, _support())
+    out = dict(
+        metric = metric,
+        gap    = round(base, 4),
+        groups = [dict(group=grouping.labels[g], n=int(grouping.sizes[g]), value=r(values[g]),
+                       gap_without=r(gaps[g]), delta=r(gaps[g] - base),
+                       overall_without=r(without[g]))
+                  for g in grouping.order],
+    )
+    if feature:
+        flabels, n, fgaps = logo_feature(ev, metric, thr, protected, feature, bins, _support())
+        out["feature"] = dict(
+            name   = feature,
+            values = [dict(value=str(flabels[i]), n=int(n[i]), gap_without=r(fgaps[i]),
+                           delta=r(fgaps[i] - base))
+                      for i in range(len(flabels)) if n[i]],
+        )
+    return jsonify(out)
+
+@app.route("/worst_slices")
+@cached_response(RESPONSE_CACHE, _cache_scope)
+def worst_slices_route():
+    """
+    Slices (conjunctions of feature values, e.g. Purpose=A43 ∧ Housing=A152)
+    whose metric deviates most from the rest of the test split, ranked by a
+    support-weighted effect size. Numeric features use their /heatmap bins.
+    """
+    metric      = request.args.get("metric", "equal_opportunity")
+    thr         = float(request.args.get("thr", 0.5))
+    bins        = int(request.args.get("bins", 6))
+    min_support = request.args.get("min_support", 30, type=int)
+    max_depth   = request.args.get("max_depth", 2, type=int)
+    top_k       = request.args.get("top_k", 20, type=int)
+
+    if metric not in METRICS:
+        return jsonify(error=f"unknown metric '{metric}'"), 400
+    if not 1 <= max_depth <= MAX_SLICE_DEPTH or top_k < 1 or min_support < 1:
+        return jsonify(error=f"need 1 <= max_depth <= {MAX_SLICE_DEPTH}, top_k >= 1, min_support >= 1"), 400
+    ev = current()
+    if ev.streaming:
+        return jsonify(error="slice discovery is not available for streamed datasets"), 400
+
+    with phase("index"):
+        index = ev.slice_index(bins)
+    with phase("search"):
+        supported, top = worst_slices(index, ev.y_test.values, ev.y_prob >= thr,
+                                      metric, min_support, max_depth, top_k)
+    r = lambda v: None if np.isnan(v) else round(v, 4)
+    for s in top:
+        s.update(metric=r(s["metric"]), rest=r(s["rest"]), score=round(s["score"], 4),
+                 label=" ∧ ".join(f"{c['feature']}={c['value']}" for c in s["slice"]))
+    return jsonify(metric=metric, supported=supported, slices=top)
+
+@app.route("/query", methods=["POST"])
+def query_route():
+    """
+    Per-group confusion counts and gaps for the rows matching a filter, e.g.
+    {"protected": ["gender", "age"], "thr": 0.5, "metric": "equal_opportunity",
+     "filter": {"Duration": {"min": 12, "max": 24}, "Purpose": ["A40", "A43"]}}.
+    Numeric columns (and "score") take ranges, categorical ones value lists.
+    """
+    data = request.get_json(silent=True)
+    if data is None:
+        data = {}
+    if not isinstance(data, dict):
+        return jsonify(error="body must be a JSON object"), 400
+    metric    = data.get("metric", "equal_opportunity")
+    protected = data.get("protected", [])
+    if isinstance(protected, str):
+        protected = [c.strip() for c in protected.split(",") if c.strip()]
+    try:
+        thr = float(data.get("thr", 0.5))
+    except (TypeError, ValueError):
+        return jsonify(error="thr must be a number"), 400
+
+    if not isinstance(metric, str) or metric not in METRICS:
+        return jsonify(error=f"unknown metric '{metric}'"), 400
+    if not isinstance(protected, list) or not all(isinstance(c, str) for c in protected):
+        return jsonify(error="protected must be a list of protected keys"), 400
+    ev = current()
+    if ev.streaming:
+        return jsonify(error="row filters are not available for streamed datasets"), 400
+    try:
+        with phase("groups"):
+            support = ev.groups.support_key(protected, _support())
+            grouping = ev.groups.grouping(protected, support)
+            groups = ev.row_index.group_bitmaps((frozenset(protected), support), grouping)
+        with phase("filter"):
+            bits = ev.row_index.mask(data.get("filter"))
+    except (KeyError, ValueError) as e:
+        return jsonify(error=str(e.args[0])), 400
+    with phase("counts"):
+        counts = ev.row_index.counts(bits, groups, thr)
+
+    r = lambda v: None if np.isnan(v) else round(float(v), 4)
+    values = metric_from_counts(metric, *counts)
+    tp, fp, tn, fn = (c.tolist() for c in counts)
+    return jsonify(
+        metric = metric,
+        rows   = sum(tp) + sum(fp) + sum(tn) + sum(fn),
+        total  = ev.n_rows,
+        gap    = round(gap(values), 4),
+        gaps   = {m: round(gap(metric_from_counts(m, *counts)), 4) for m in METRICS},
+        groups = [dict(group=grouping.labels[g], n=tp[g] + fp[g] + tn[g] + fn[g],
+                       TP=tp[g], FP=fp[g], TN=tn[g], FN=fn[g], value=r(values[g]))
+                  for g in grouping.order],
+    )
+
+@app.errorhandler(ProtectedKeyError)
+def handle_protected_key(e):
+    """Bad ?protected= / ?prot= keys on any group route → 400."""
+    return jsonify(error=e.args[0]), 400
 
 @app.errorhandler(Exception)
 def handle_exception(e):
+    if isinstance(e, HTTPException):
+        return jsonify(error=e.description), e.code
     import traceback, sys
     traceback.print_exc(file=sys.stdout)
     return jsonify(error=str(e)), 500
 
+def _heatmap_matrix(ev, metric, feature, bins, protected, thr, component, support=None):
+    """{rows, cols, values}: metric per (feature bin × protected group), observed cells only."""
+    # 1.  confusion cells per (pgroup, fbin) ---------------------------
+    with phase("bin"):
+        grouping, flabels, tp, fp, tn, fn = ev.heatmap_cells(feature, bins, protected, thr, support)
+    plabels = grouping.raw_labels
+
+    # 2.  metric value per cell --------------------------------------
+    vals = metric_from_counts(metric, tp, fp, tn, fn, component=component)
+
+    # keep only observed cells / rows / cols, like a groupby would
+    n = tp + fp + tn + fn
+    vals[n == 0] = np.nan
+    rows_keep = np.flatnonzero(n.sum(axis=0))
+    cols_keep = sorted(np.flatnonzero(n.sum(axis=1)), key=plabels.__getitem__)
+    mat = vals[np.ix_(cols_keep, rows_keep)].T
+
+    return dict(
+        rows   = [str(flabels[r]) for r in rows_keep],
+        cols   = [plabels[c] for c in cols_keep],
+        values = _json_grid(mat)
+    )
+
 @app.route("/heatmap")
+@cached_response(RESPONSE_CACHE, _cache_scope)
 def heatmap_api():
     metric   = request.args["metric"]
     feature  = request.args["feature"]
@@ -401,165 +654,371 @@ def heatmap_api():
     thr      = float(request.args.get("thr", .5))
     component  = request.args.get("component", "tpr")  # NEW 'tpr' or 'fpr'
 
+    ev = current()
+
     # 0.  sanity-check
-    if feature not in X_test.columns:
+    if feature not in ev.feature_names:
         return jsonify(error=f"feature '{feature}' not found"), 400
 
     prot_param = request.args.get("prot", "age")
     current_protected = [p for p in prot_param.split(",") if p]
 
-    df = X_test.copy()
-    df["label"] = y_test.values
-    df["pred"]  = (y_prob >= thr).astype(int)
+    return jsonify(_heatmap_matrix(ev, metric, feature, bins, current_protected, thr, component,
+                                   _support()))
 
-    # 1.  generate fbin labels  ---------------------------------------
-    if pd.api.types.is_numeric_dtype(df[feature]):
-
-        # equal-population edges, duplicates collapsed
-        edges  = np.unique(
-            np.quantile(df[feature], np.linspace(0, 1, bins + 1))
-        )
-        labels = [f"{int(edges[i])}–{int(edges[i+1])}"
-                for i in range(len(edges) - 1)]
-
-        # build an *ordered* Categorical so groupby keeps this order
-        cat_type = pd.CategoricalDtype(categories=labels, ordered=True)
-        df["fbin"] = pd.cut(
-            df[feature],
-            bins=edges,
-            labels=labels,
-            include_lowest=True,
-            duplicates="drop"
-        ).astype(cat_type)
-    else:
-        df["fbin"] = df[feature].astype(str)
-
-    # 2.  build pgroup  ----------------------------------------------
-    col_map = [PROTECTED_ATTRS[c] for c in current_protected if c]
-
-    if not col_map:
-        df["pgroup"] = "All"
-
-    elif len(col_map) == 1:
-        col = col_map[0]
-        if col.lower() == "age" and pd.api.types.is_numeric_dtype(df[col]):
-            df["pgroup"] = bucket_age(df[col]).astype(str)
-        else:
-            df["pgroup"] = df[col].astype(str)
-
-    else:  # intersection of two protected attributes  ★ FIX ★
-        col1, col2 = col_map
-        def as_cat(s):
-            if s.name.lower() == "age" and pd.api.types.is_numeric_dtype(s):
-                return bucket_age(s).astype(str)
-            return s.astype(str)
-        df["pgroup"] = as_cat(df[col1]) + " | " + as_cat(df[col2])
-        
-
-    # ── metric value per (pgroup, fbin) ────────────────────
-    def fair_ratio(sub):
-        tp = ((sub.label==1)&(sub.pred==1)).sum()
-        fp = ((sub.label==0)&(sub.pred==1)).sum()
-        tn = ((sub.label==0)&(sub.pred==0)).sum()
-        fn = ((sub.label==1)&(sub.pred==0)).sum()
-
-        if metric == "equal_opportunity":   return tp/(tp+fn) if tp+fn else np.nan
-        if metric == "predictive_parity":   return tp/(tp+fp) if tp+fp else np.nan
-        if metric == "predictive_equality": return fp/(fp+tn) if fp+tn else np.nan
-        if metric == "demographic_parity":  return (tp+fp)/(tp+fp+tn+fn)
-        if metric == "treatment_equality":  return fn/fp if fp else np.nan
-        if metric == "equalized_odds":     
-            if component == "tpr":
-                return tp/(tp+fn) if tp+fn else np.nan
-            else:  # 'fpr'
-                return fp/(fp+tn) if fp+tn else np.nan
-        return np.nan
-
-    mat = (df
-            .groupby(["pgroup", "fbin"])
-            .apply(fair_ratio)
-            .unstack("pgroup"))
-
-    # convert every numeric value to float, NaN → None (=> null in JSON)
-    value_grid = [
-        [None if pd.isna(v) else float(v) for v in row]
-        for row in mat.values
-    ]
-
-    return jsonify(
-        rows   = [str(r) for r in mat.index],
-        cols   = list(mat.columns),
-        values = value_grid
-    )
+@app.route("/heatmap_batch")
+@cached_response(RESPONSE_CACHE, _cache_scope, compress=True)
+def heatmap_batch_api():
+    """
+    /heatmap for many features in one response: {"features": {feature: {rows, cols, values}}}.
+    features=<comma list> (default: every feature); other parameters as for /heatmap.
+    """
+    metric    = request.args["metric"]
+    bins      = int(request.args.get("bins", 6))
+    thr       = float(request.args.get("thr", .5))
+    component = request.args.get("component", "tpr")
+    protected = [p for p in request.args.get("prot", "age").split(",") if p]
+
+    ev = current()
+    features = [f.strip() for f in request.args.get("features", "").split(",") if f.strip()]
+    features = features or ev.feature_names
+    missing  = [f for f in features if f not in ev.feature_names]
+    if missing:
+        return jsonify(error=f"feature(s) not found: {', '.join(missing)}"), 400
+
+    return jsonify(features={
+        f: _heatmap_matrix(ev, metric, f, bins, protected, thr, component, _support())
+        for f in features
+    })
+
+@app.route("/snapshot")
+@cached_response(RESPONSE_CACHE, _cache_scope, compress=True)
+def snapshot_route():
+    """
+    Everything a threshold / metric change redraws, in one round trip:
+    {"gap", "groups" (counts + every metric per group), "sankey",
+     "heatmaps": {feature: {rows, cols, values}}} for ?heatmaps=<features>
+    (prot=, bins=, component= as for /heatmap). ?panels= picks a subset.
+    stream=ndjson sends one {"panel", "data"} line per panel as soon as it
+    is ready (heatmaps one per feature, with "feature"); stream=sse sends
+    them as server-sent events. Both end with a "done" panel.
+    """
+    metric    = request.args.get("metric", "equal_opportunity")
+    thr       = float(request.args.get("thr", 0.5))
+    protected = [c.strip() for c in request.args.get("protected", "").split(",") if c.strip()]
+    hprot     = [p for p in request.args.get("prot", ",".join(protected) or "age").split(",") if p]
+    bins      = int(request.args.get("bins", 6))
+    component = request.args.get("component", "tpr")
+    features  = [f.strip() for f in request.args.get("heatmaps", "").split(",") if f.strip()]
+    panels    = [p.strip() for p in request.args.get("panels", "").split(",") if p.strip()]
+    stream    = request.args.get("stream")
+
+    ev = current()
+    if metric not in METRICS:
+        return jsonify(error=f"unknown metric '{metric}'"), 400
+    unknown = [p for p in panels if p not in SNAPSHOT_PANELS]
+    if unknown:
+        return jsonify(error=f"unknown panel(s): {', '.join(unknown)}"), 400
+    missing = [f for f in features if f not in ev.feature_names]
+    if missing:
+        return jsonify(error=f"feature(s) not found: {', '.join(missing)}"), 400
+    if stream not in (None, "ndjson", "sse"):
+        return jsonify(error=f"unknown stream format '{stream}'"), 400
+    panels = [p for p in SNAPSHOT_PANELS if p in panels] if panels else SNAPSHOT_PANELS
+    support = _support()
+    # bad protected keys must fail before a stream has started
+    ev.groups.grouping(protected, support)
+    if features:
+        ev.groups.grouping(hprot, support)
+
+    def produce():
+        """(panel, feature or None, data) in SNAPSHOT_PANELS order, from one set of counts."""
+        with phase("groups"):
+            grouping, sweep = ev.sweep_for(protected, support)
+        with phase("counts"):
+            counts = np.stack(sweep.counts(thr))                  # [4, G]
+        if "gap" in panels:
+            g = gap(metric_from_counts(metric, *counts)) if protected else 0.0
+            yield "gap", None, dict(metric=metric, gap=round(g, 4))
+        if "groups" in panels:
+            r = lambda v: None if np.isnan(v) else round(float(v), 4)
+            values = {m: metric_from_counts(m, *counts) for m in METRICS}
+            tp, fp, tn, fn = (c.tolist() for c in counts)
+            yield "groups", None, [
+                dict(group=grouping.labels[g], n=tp[g] + fp[g] + tn[g] + fn[g],
+                     TP=tp[g], FP=fp[g], TN=tn[g], FN=fn[g],
+                     metrics={m: r(v[g]) for m, v in values.items()})
+                for g in grouping.order]
+        if "sankey" in panels:
+            yield "sankey", None, sankey_payload(ev, protected, thr, metric, support)
+        if "heatmaps" in panels:
+            for f in features:
+                yield "heatmaps", f, _heatmap_matrix(ev, metric, f, bins, hprot, thr, component, support)
+
+    if stream is None:
+        out = {}
+        for panel, feature, data in produce():
+            if feature is None:
+                out[panel] = data
+            else:
+                out.setdefault(panel, {})[feature] = data
+        return jsonify(out)
+
+    def encode(panel, feature=None, data=None):
+        item = dict(panel=panel, data=data) if feature is None else dict(panel=panel, feature=feature, data=data)
+        body = app.json.dumps(item)
+        return f"event: {panel}\ndata: {body}\n\n" if stream == "sse" else body + "\n"
+
+    def events():
+        for panel, feature, data in produce():
+            yield encode(panel, feature, data)
+        yield encode("done")
+
+    mimetype = "text/event-stream" if stream == "sse" else "application/x-ndjson"
+    return app.response_class(stream_with_context(events()), mimetype=mimetype)
 
 @app.route("/feature_list")
 def feature_list():
     """Return every original column in X_test so the front-end knows what's valid."""
-    return jsonify(list(X_test.columns))
-
-@app.route("/pcp_data")
-def pcp_data():
-    """Return row-wise data for the parallel-coordinates plot."""
-    thr = float(request.args.get("thr", 0.5))
+    return jsonify(current().feature_names)
 
-    df = X_test.copy()
+def _pcp_frame(ev):
+    """X_test + label/score with categoricals as strings; (frame, num_cols, cat_cols)."""
+    df = ev.X_test.copy()
 
     # columns used for PCP
     # (keep original numeric cols; keep object/string as categoricals)
     num_cols = df.select_dtypes(include=[np.number]).columns.tolist()
     cat_cols = [c for c in df.columns if c not in num_cols]
 
-    # add target/prediction/score
-    df["true_label"] = y_test.values.astype(int)
-    df["prediction"] = (y_prob >= thr).astype(int)
-    df["score"]      = y_prob.astype(float)
+    # add target/score
+    df["true_label"] = ev.y_test.values.astype(int)
+    df["score"]      = ev.y_prob.astype(float)
 
     # make categoricals JSON-friendly
     for c in cat_cols:
         df[c] = df[c].astype(str).fillna("NA")
 
+    return df, num_cols, cat_cols
+
+
+def _pcp_columnar(df, num_cols, cat_cols):
+    """
+    Column-oriented PCP payload. Categoricals are dictionary-encoded
+    (codes into a per-column dictionary), numerics are typed arrays.
+    No prediction column: the client derives it as score >= thr.
+    """
+    columns = {}
+    for c in df.columns:
+        col = df[c]
+        if c in cat_cols:
+            codes, uniques = pd.factorize(col, sort=True)
+            columns[c] = {"type": "dict", "dictionary": list(uniques), "codes": codes.tolist()}
+        else:
+            dtype = "float64" if pd.api.types.is_float_dtype(col) else "int64"
+            columns[c] = {"type": dtype, "values": col.tolist()}
+    return columns
+
+
+def _pcp_arrow(df, num_cols, cat_cols):
+    """Same columns as an Arrow IPC stream (needs the optional pyarrow package)."""
+    import json
+    import pyarrow as pa
+
+    arrays = {}
+    for c in df.columns:
+        if c in cat_cols:
+            codes, uniques = pd.factorize(df[c], sort=True)
+            arrays[c] = pa.DictionaryArray.from_arrays(pa.array(codes, pa.int32()), pa.array(list(uniques)))
+        else:
+            arrays[c] = pa.array(df[c].to_numpy())
+    meta = {"numericKeys": json.dumps(num_cols + ["score"]), "catKeys": json.dumps(cat_cols)}
+    table = pa.table(arrays).replace_schema_metadata(meta)
+
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+@app.route("/pcp_data")
+@cached_response(RESPONSE_CACHE, _cache_scope, compress=True)
+def pcp_data():
+    """
+    Data for the parallel-coordinates plot.
+      format=records  (default) row objects incl. prediction at ?thr
+      format=columnar threshold-independent, dictionary-encoded columns
+      format=arrow    Arrow IPC stream of the same columns (optional pyarrow)
+    """
+    fmt = request.args.get("format", "records")
+    ev  = current()
+    if ev.streaming:
+        return jsonify(error="row-level PCP data is not available for streamed datasets"), 400
+    with phase("frame"):
+        df, num_cols, cat_cols = _pcp_frame(ev)
+
     # OPTIONAL: don’t send everything if your dataset is large
     # df = df.sample(n=min(len(df), 1500), random_state=0)
 
+    if fmt == "columnar":
+        with phase("encode"):
+            columns = _pcp_columnar(df, num_cols, cat_cols)
+        return jsonify(
+            format="columnar",
+            length=len(df),
+            columns=columns,
+            order=list(df.columns),
+            numericKeys=num_cols + ["score"],
+            catKeys=cat_cols
+        )
+
+    if fmt == "arrow":
+        try:
+            with phase("encode"):
+                body = _pcp_arrow(df, num_cols, cat_cols)
+        except ImportError:
+            return jsonify(error="format=arrow needs the pyarrow package"), 501
+        return app.response_class(body, mimetype="application/vnd.apache.arrow.stream")
+
+    if fmt != "records":
+        return jsonify(error=f"unknown format '{fmt}'"), 400
+
+    thr = float(request.args.get("thr", 0.5))
+    df.insert(df.columns.get_loc("score"), "prediction", (ev.y_prob >= thr).astype(int))
+
+    with phase("encode"):
+        records = df.to_dict(orient="records")
     return jsonify(
-        data=df.to_dict(orient="records"),
+        data=records,
         numericKeys=[c for c in num_cols + ["score"] if c in df.columns],
         catKeys=[c for c in cat_cols if c in df.columns]
     )
 
 
+@app.route("/cache_stats")
+def cache_stats():
+    """Hit/miss counters and size of the response cache."""
+    return jsonify(RESPONSE_CACHE.stats())
+
+
+@app.route("/metrics")
+def metrics_route():
+    """Prometheus text: per-endpoint latency/size histograms, phase time, rows, cache hits."""
+    return app.response_class(instrument.METRICS.render(RESPONSE_CACHE.stats()),
+                              mimetype="text/plain; version=0.0.4")
+
+
+@app.route("/datasets")
+def datasets_route():
+    """Registered (dataset, model) pairs and whether each is currently loaded."""
+    return jsonify(REGISTRY.status())
+
+
+@app.route("/retrain", methods=["POST"])
+def retrain_submit():
+    """
+    Queue a background retrain; answers 202 with the job's status at once.
+    Body: {"dataset": ..., "model": ..., "config": {...}} where config may set
+    test_size, random_state, split_column, max_iter, solver, class_weight,
+    C, tol, fit_intercept, l1_ratio and cv (k-fold evaluation, k >= 2).
+    The new model replaces the old one when the job finishes.
+    """
+    data = request.get_json(silent=True)
+    if data is None:
+        data = {}
+    if not isinstance(data, dict):
+        return jsonify(error="body must be a JSON object"), 400
+    if not isinstance(data.get("config", {}), dict):
+        return jsonify(error="config must be an object"), 400
+    if not all(isinstance(data.get(k), (str, type(None))) for k in ("dataset", "model")):
+        return jsonify(error="dataset and model must be names"), 400
+    try:
+        job = JOBS.submit(data.get("dataset"), data.get("model"), data.get("config"))
+    except (KeyError, ValueError) as e:
+        return jsonify(error=str(e.args[0])), 400
+    return jsonify(job.status()), 202
+
+
+@app.route("/retrain")
+def retrain_list():
+    """Status of every retrain job since the server started, whichever worker runs it."""
+    return jsonify([job.status() for job in JOBS.list()])
+
+
+@app.route("/retrain/<job_id>")
+def retrain_status(job_id):
+    """One job: state, current stage, per-stage seconds, new version and cv scores."""
+    job = JOBS.get(job_id)
+    if job is None:
+        abort(404, description=f"unknown job '{job_id}'")
+    return jsonify(job.status())
+
+
 @app.route("/repredict", methods=["POST"])
 def repredict():
     """
     Re-run predictions on neutralized data.
-    Receives a list of data rows with potentially modified feature values.
-    Returns new prediction scores.
+    Preferred body is a delta – {"ids": [row, ...], "changes": {feature: [value per id]}} –
+    answered with {"ids": [...], "scores": [...]} for just those rows.
+    The legacy {"rows": [...]} body (every row, every column) is still accepted.
     """
     try:
         data = request.get_json()
+        if not isinstance(data, dict):
+            return jsonify({"error": "body must be a JSON object"}), 400
+        ev = current()
+        if ev.streaming:
+            return jsonify({"error": "repredict is not available for streamed datasets"}), 400
+
+        if "ids" in data:
+            ids, changes = data["ids"], data.get("changes", {})
+            if not isinstance(changes, dict):
+                return jsonify({"error": "changes must be an object mapping column -> list of values"}), 400
+            try:
+                with phase("rescore"):
+                    scores = ev.rescorer.rescore(ids, changes)
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
+            return jsonify({"ids": ids, "scores": scores.tolist()})
+
         rows = data.get("rows", [])
 
         if not rows:
             return jsonify({"error": "No rows provided"}), 400
+        if not isinstance(rows, list) or not all(isinstance(r, dict) for r in rows):
+            return jsonify({"error": "rows must be a list of row objects"}), 400
 
         # Convert to DataFrame
         df_neutral = pd.DataFrame(rows)
 
         # Extract only the feature columns (exclude target, prediction, score, etc.)
-        feature_cols = X_test.columns.tolist()
+        feature_cols = ev.X_test.columns.tolist()
         df_features = df_neutral[feature_cols]
 
         # Get new predictions from the trained model
-        new_proba = clf.predict_proba(df_features)[:, 1]
+        with phase("rescore"):
+            new_proba = ev.clf.predict_proba(df_features)[:, 1]
 
         # Return as list
         return jsonify({
             "scores": new_proba.tolist()
         })
 
+    except HTTPException:
+        raise
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
+@app.cli.command("build-artifacts")
+@click.option("--dataset", default=None, help="registered dataset (default: all)")
+def build_artifacts_command(dataset):
+    """Retrain and rewrite the model/prediction artifacts."""
+    for name in ([dataset] if dataset else list(REGISTRY.specs)):
+        for model in REGISTRY.specs[name]["models"]:
+            ev = REGISTRY.reload(name, model, force=True)
+            print("Artifact written to", ev.artifact.path)
+
+
 if __name__ == "__main__":
     app.run(debug=True, port=5000)
@@ -0,0 +1,205 @@
+"""
+Persisted model + prediction artifacts.
+
+Everything the server derives from (CSV, target, hyperparameters) – the
+fitted pipeline, the test split, y_prob and the protected-group codes – is
+written once under ARTIFACT_ROOT/<content hash>/ and memory-mapped on later
+starts. sklearn is only imported when an artifact has to be (re)built or
+when the pipeline itself is needed (e.g. /repredict).
+"""
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import threading
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from groups import GroupIndex
+
+ARTIFACT_ROOT    = Path("artifacts")
+ARTIFACT_VERSION = 2                        # bump when the layout changes
+
+# optional LogisticRegression settings passed through from the params when present
+LOGREG_EXTRA = ("C", "tol", "fit_intercept", "l1_ratio")
+
+
+def _file_digest(csv_path: Path) -> str:
+    """blake2b of the CSV bytes, memoised on (path, size, mtime) so restarts skip re-hashing."""
+    st = csv_path.stat()
+    memo_path = ARTIFACT_ROOT / "digests.json"
+    memo = json.loads(memo_path.read_text()) if memo_path.exists() else {}
+    stamp = f"{csv_path.resolve()}:{st.st_size}:{st.st_mtime_ns}"
+    if stamp in memo:
+        return memo[stamp]
+
+    h = hashlib.blake2b(digest_size=16)
+    with open(csv_path, "rb") as fh:
+        for block in iter(lambda: fh.read(1 << 20), b""):
+            h.update(block)
+    memo[stamp] = h.hexdigest()
+    ARTIFACT_ROOT.mkdir(parents=True, exist_ok=True)
+    memo_path.write_text(json.dumps(memo))
+    return memo[stamp]
+
+
+def content_key(csv_path, target, params, protected_attrs, positive=1) -> str:
+    """Hash of the CSV contents plus everything that shapes the artifact."""
+    config = json.dumps({"version": ARTIFACT_VERSION, "target": target, "positive": positive,
+                         "params": params, "protected": protected_attrs}, sort_keys=True)
+    h = hashlib.blake2b(digest_size=16)
+    h.update(_file_digest(Path(csv_path)).encode())
+    h.update(config.encode())
+    return h.hexdigest()
+
+
+class Artifact:
+    """Read side of one artifact directory; arrays come back memory-mapped."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.meta = json.loads((self.path / "meta.json").read_text())
+
+        self.test_idx = np.load(self.path / "test_idx.npy", mmap_mode="r")
+        self.y_test   = np.load(self.path / "y_test.npy",   mmap_mode="r")
+        self.y_prob   = np.load(self.path / "y_prob.npy",   mmap_mode="r")
+        self.X_test   = pd.read_pickle(self.path / "X_test.pkl")
+        self.groups   = GroupIndex.load(self.path / "groups")
+
+        self._model = None
+        self._lock  = threading.Lock()
+
+    @property
+    def model(self):
+        """The fitted sklearn Pipeline, unpickled on first use."""
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    with open(self.path / "model.pkl", "rb") as fh:
+                        self._model = pickle.load(fh)
+        return self._model
+
+
+def _noop(stage):
+    pass
+
+
+def train(X, y, params, split=None, progress=_noop, cv=None):
+    """
+    Fit the OneHotEncoder + LogisticRegression pipeline; (clf, test_idx, cv scores).
+    `split` (values of params["split_column"]) marks test rows with "test";
+    otherwise the split is a stratified train_test_split. cv = k adds k-fold
+    scores of the training rows, folds fitted in parallel.
+    """
+    from sklearn.base import clone
+    from sklearn.compose import ColumnTransformer
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.model_selection import StratifiedKFold, cross_validate, train_test_split
+    from sklearn.pipeline import Pipeline
+    from sklearn.preprocessing import OneHotEncoder
+
+    cat_cols = X.select_dtypes(include="object").columns.tolist()
+    prep = ColumnTransformer(
+        transformers=[("cat", OneHotEncoder(handle_unknown="ignore"), cat_cols)],
+        remainder="passthrough"
+    )
+    clf = Pipeline([
+        ("prep", prep),
+        ("logreg", LogisticRegression(max_iter=params["max_iter"], solver=params["solver"],
+                                      class_weight=params["class_weight"],
+                                      **{k: params[k] for k in LOGREG_EXTRA if k in params}))
+    ])
+
+    if split is not None:
+        is_test = split.astype(str).str.strip().str.lower().eq("test").to_numpy()
+        train_idx, test_idx = np.flatnonzero(~is_test), np.flatnonzero(is_test)
+        if not len(train_idx) or not len(test_idx):
+            raise ValueError(f"split column '{params['split_column']}' needs both train and 'test' rows")
+    else:
+        train_idx, test_idx = train_test_split(
+            np.arange(len(X)), test_size=params["test_size"], stratify=y,
+            random_state=params["random_state"]
+        )
+    X_train = X.iloc[train_idx].reset_index(drop=True)
+    y_train = y.iloc[train_idx].reset_index(drop=True)
+
+    if cv:
+        progress("cv")
+        folds = StratifiedKFold(cv, shuffle=True, random_state=params.get("random_state"))
+        scores = cross_validate(clone(clf), X_train, y_train, cv=folds, n_jobs=-1,
+                                scoring=("accuracy", "roc_auc"))
+        cv = {"folds": folds.n_splits,
+              "accuracy": scores["test_accuracy"].round(4).tolist(),
+              "roc_auc": scores["test_roc_auc"].round(4).tolist()}
+
+    progress("fit")
+    clf.fit(X_train, y_train)
+    return clf, test_idx, cv
+
+
+def build(csv_path, target, params, protected_attrs, path, positive=1, progress=_noop,
+          cv=None) -> Artifact:
+    """
+    Train from the CSV and write a complete artifact directory at `path`.
+    `progress(stage)` is called as each stage starts (read, cv, fit, predict, write);
+    cv = k stores k-fold scores in meta.json (they don't change the model).
+    """
+    progress("read")
+    df = pd.read_csv(csv_path)
+    y = (df[target] == positive).astype(int)      # German credit: 1 = good → 1, 2 = bad → 0
+    X = df.drop(columns=[target])
+    split = None
+    if params.get("split_column"):
+        if params["split_column"] not in X.columns:
+            raise ValueError(f"split column '{params['split_column']}' not found in {csv_path}")
+        split = X.pop(params["split_column"])
+
+    clf, test_idx, cv = train(X, y, params, split, progress, cv)
+    progress("predict")
+    X_test = X.iloc[test_idx].reset_index(drop=True)
+    y_test = y.iloc[test_idx].to_numpy(dtype=np.int8)
+    y_prob = clf.predict_proba(X_test)[:, 1]
+
+    progress("write")
+
+    # write to a temp dir and rename, so a crash never leaves half an artifact
+    path = Path(path)
+    tmp = path.with_name(path.name + f".tmp{os.getpid()}")
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir(parents=True)
+
+    np.save(tmp / "test_idx.npy", np.asarray(test_idx, dtype=np.int64))
+    np.save(tmp / "y_test.npy", y_test)
+    np.save(tmp / "y_prob.npy", y_prob)
+    X_test.to_pickle(tmp / "X_test.pkl")
+    GroupIndex(X_test, protected_attrs).save(tmp / "groups")
+    with open(tmp / "model.pkl", "wb") as fh:
+        pickle.dump(clf, fh, protocol=pickle.HIGHEST_PROTOCOL)
+    (tmp / "meta.json").write_text(json.dumps({
+        "csv": str(csv_path), "target": target, "positive": positive, "params": params,
+        "protected": protected_attrs, "rows": len(df), "test_rows": len(X_test), "cv": cv,
+    }, indent=2))
+
+    shutil.rmtree(path, ignore_errors=True)
+    tmp.rename(path)
+
+    art = Artifact(path)
+    art._model = clf
+    return art
+
+
+def load_or_build(csv_path, target, params, protected_attrs, positive=1, force=False,
+                  progress=_noop, cv=None) -> Artifact:
+    """
+    Artifact for this (CSV, config); built only when missing, `force`, or cv = k
+    asks for k-fold scores the stored artifact doesn't have.
+    """
+    path = ARTIFACT_ROOT / content_key(csv_path, target, params, protected_attrs, positive)
+    if not force and (path / "meta.json").exists():
+        art = Artifact(path)
+        if not cv or (art.meta.get("cv") or {}).get("folds") == cv:
+            return art
+    return build(csv_path, target, params, protected_attrs, path, positive, progress, cv)
@@ -0,0 +1,232 @@
+"""
+Benchmark harness: synthetic scale-up data + endpoint / helper timings.
+
+    python benchmark.py generate --rows 1m             # bench_data/synth_1m.csv
+    python benchmark.py run --sizes 10k,1m -o bench.json
+    python benchmark.py compare old.json new.json
+
+Synthetic data resamples whole rows of the German credit CSV (so every
+categorical distribution and the Gender / Marital_status / Age columns
+keep their joint shape) and jitters the continuous columns so rows are
+not exact copies. Each size is registered as its own dataset and every
+endpoint is timed through the Flask test client with the response cache
+cleared, across metrics, thresholds and protected sets. Latency is taken
+from untraced repeats; peak Python heap (tracemalloc, numpy included) is
+measured in one extra traced call.
+"""
+import contextlib
+import io
+import json
+import platform
+import resource
+import statistics
+import subprocess
+import time
+import tracemalloc
+from pathlib import Path
+
+import click
+import numpy as np
+import pandas as pd
+
+BENCH_DIR  = Path("bench_data")
+SIZES      = {"10k": 10_000, "1m": 1_000_000, "10m": 10_000_000}
+WRITE_ROWS = 500_000            # rows generated / written per CSV chunk
+
+THRESHOLDS = (0.3, 0.5, 0.7)
+PROTECTED  = ("gender", "age", "gender,marital_status,age")
+METRICS    = ("demographic_parity", "equal_opportunity", "treatment_equality")
+
+
+# ------------------------------------------------------------------ #
+#  Synthetic data                                                     #
+# ------------------------------------------------------------------ #
+def synth_chunk(source: pd.DataFrame, n, rng):
+    """n rows resampled from `source` with continuous columns jittered."""
+    df = source.iloc[rng.integers(0, len(source), n)].reset_index(drop=True)
+    lo, hi = source.min(numeric_only=True), source.max(numeric_only=True)
+
+    df["Duration"] = np.clip(df["Duration"] + rng.integers(-3, 4, n), lo["Duration"], hi["Duration"])
+    df["CreditAmount"] = np.clip(np.round(df["CreditAmount"] * rng.lognormal(0, 0.1, n)),
+                                 lo["CreditAmount"], hi["CreditAmount"]).astype(np.int64)
+    df["Age"] = np.clip(df["Age"] + rng.integers(-2, 3, n), lo["Age"], hi["Age"])
+    return df
+
+
+def generate(rows, source_csv, out, seed=0) -> Path:
+    """Write a schema-compatible CSV of `rows` rows to `out` (skipped if it already exists)."""
+    out = Path(out)
+    if out.exists():
+        return out
+    out.parent.mkdir(parents=True, exist_ok=True)
+    source = pd.read_csv(source_csv)
+    rng = np.random.default_rng(seed)
+    tmp = out.with_suffix(".tmp")
+    for i, lo in enumerate(range(0, rows, WRITE_ROWS)):
+        synth_chunk(source, min(WRITE_ROWS, rows - lo), rng).to_csv(
+            tmp, mode="a" if i else "w", header=not i, index=False)
+    tmp.rename(out)
+    return out
+
+
+def _rows(label):
+    return SIZES.get(label) or int(float(label))
+
+
+# ------------------------------------------------------------------ #
+#  Timing                                                             #
+# ------------------------------------------------------------------ #
+def measure(fn, repeat):
+    """(latencies in ms, peak traced bytes, result of the last call)."""
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn()
+        times.append((time.perf_counter() - t0) * 1e3)
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return times, peak, out
+
+
+def _record(results, size, name, params, times, peak, nbytes=None):
+    times = sorted(times)
+    results.append(dict(
+        size=size, name=name, params=params, repeat=len(times),
+        min_ms=round(times[0], 3), median_ms=round(statistics.median(times), 3),
+        p95_ms=round(times[min(len(times) - 1, int(0.95 * len(times)))], 3),
+        peak_mb=round(peak / 2**20, 3), bytes=nbytes,
+    ))
+
+
+def bench_size(app, label, repeat, results):
+    rows = _rows(label)
+    name = f"synth_{label}"
+    path = generate(rows, app.CSV_PATH, BENCH_DIR / f"{name}.csv")
+    app.REGISTRY.register(name, path, app.TARGET_COLUMN, app.PROTECTED_ATTRS,
+                          {"logreg": app.MODEL_PARAMS})
+
+    # load (builds the artifact on the first run for this CSV)
+    with contextlib.redirect_stdout(io.StringIO()):
+        t0 = time.perf_counter()
+        ev = app.REGISTRY.get(name)
+    _record(results, label, "load", {}, [(time.perf_counter() - t0) * 1e3], 0)
+
+    client = app.app.test_client()
+
+    def endpoint(url, method="get", **kw):
+        def call():
+            app.RESPONSE_CACHE.clear()
+            resp = getattr(client, method)(url, **kw)
+            assert resp.status_code == 200, (url, resp.status_code, resp.get_data()[:200])
+            return resp
+        times, peak, resp = measure(call, repeat)
+        path, _, query = url.partition("?")
+        params = dict(q.split("=", 1) for q in query.split("&") if "=" in q)
+        params.pop("dataset", None)
+        _record(results, label, path, params, times, peak, len(resp.get_data()))
+
+    q = f"dataset={name}"
+    for prot in PROTECTED:
+        cols = prot.split(",")
+        for thr in THRESHOLDS:
+            for metric in METRICS:
+                endpoint(f"/sankey?{q}&metric={metric}&thr={thr}&protected={prot}")
+                endpoint(f"/metric_gap?{q}&metric={metric}&thr={thr}&protected={prot}")
+                times, peak, _ = measure(lambda: app.metric_gap(ev, metric, thr, cols), repeat)
+                _record(results, label, "metric_gap()", dict(metric=metric, thr=thr, protected=prot),
+                        times, peak)
+                times, peak, _ = measure(lambda: app.build_sankey_json(ev, cols, thr, metric), repeat)
+                _record(results, label, "build_sankey_json()",
+                        dict(metric=metric, thr=thr, protected=prot), times, peak)
+            endpoint(f"/heatmap?{q}&metric=equal_opportunity&thr={thr}&prot={prot}&feature=Duration")
+            endpoint(f"/heatmap?{q}&metric=equal_opportunity&thr={thr}&prot={prot}&feature=Purpose")
+        endpoint(f"/metric_curve?{q}&protected={prot}&max_points=200")
+        endpoint(f"/heatmap_batch?{q}&metric=equal_opportunity&prot={prot}")
+        endpoint(f"/logo?{q}&protected={prot}&feature=Purpose")
+        endpoint(f"/neutralize_ranking?{q}&protected={prot}")
+        endpoint(f"/metric_gap?{q}&protected={prot}&ci=0.95&n_boot=1000")
+
+    endpoint(f"/pcp_data?{q}&format=columnar")
+    endpoint(f"/worst_slices?{q}&max_depth=2")
+
+    # /repredict delta: 1% of rows (at least 10) get a new Duration and Status
+    n = len(ev.X_test)
+    ids = np.random.default_rng(0).choice(n, max(10, n // 100), replace=False)
+    body = {"ids": ids.tolist(), "changes": {
+        "Duration": ev.X_test["Duration"].to_numpy()[ids[::-1]].tolist(),
+        "Status":   ev.X_test["Status"].astype(str).to_numpy()[ids[::-1]].tolist()}}
+    endpoint(f"/repredict?{q}", method="post", json=body)
+
+
+def _revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# ------------------------------------------------------------------ #
+#  CLI                                                                #
+# ------------------------------------------------------------------ #
+@click.group()
+def cli():
+    """Synthetic data generation and endpoint benchmarks."""
+
+
+@cli.command("generate")
+@click.option("--rows", default="1m", help="row count or one of 10k / 1m / 10m")
+@click.option("--seed", default=0)
+@click.option("--out", default=None, help="output CSV (default bench_data/synth_<rows>.csv)")
+def generate_command(rows, seed, out):
+    import app
+    click.echo(generate(_rows(rows), app.CSV_PATH, out or BENCH_DIR / f"synth_{rows}.csv", seed))
+
+
+@cli.command("run")
+@click.option("--sizes", default="10k", help="comma list of sizes, e.g. 10k,1m,10m")
+@click.option("--repeat", default=5, help="timed calls per measurement")
+@click.option("-o", "--out", default="bench.json", help="JSON report path")
+def run_command(sizes, repeat, out):
+    with contextlib.redirect_stdout(io.StringIO()):
+        import app
+    results = []
+    for label in sizes.split(","):
+        click.echo(f"benchmarking {label} rows …")
+        bench_size(app, label.strip(), repeat, results)
+
+    report = dict(
+        revision = _revision(),
+        created  = time.strftime("%Y-%m-%dT%H:%M:%S"),
+        python   = platform.python_version(),
+        numpy    = np.__version__,
+        pandas   = pd.__version__,
+        max_rss_mb = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        results  = results,
+    )
+    Path(out).write_text(json.dumps(report, indent=1))
+    click.echo(f"{len(results)} measurements written to {out}")
+
+
+@cli.command("compare")
+@click.argument("old", type=click.Path(exists=True))
+@click.argument("new", type=click.Path(exists=True))
+def compare_command(old, new):
+    """Median latency and peak memory per measurement in two reports, with new/old ratios."""
+    def load(path):
+        df = pd.DataFrame(json.loads(Path(path).read_text())["results"])
+        df["params"] = df["params"].map(lambda p: json.dumps(p, sort_keys=True))
+        return df.set_index(["size", "name", "params"])[["median_ms", "peak_mb"]]
+
+    both = load(old).join(load(new), lsuffix="_old", rsuffix="_new", how="outer")
+    both["ratio"] = (both["median_ms_new"] / both["median_ms_old"]).round(3)
+    with pd.option_context("display.max_rows", None, "display.max_colwidth", 80):
+        click.echo(both.sort_values("ratio", ascending=False).to_string())
+
+
+if __name__ == "__main__":
+    cli()
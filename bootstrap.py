@@ -0,0 +1,63 @@
+"""
+Bootstrap confidence intervals for per-group metrics and their gap.
+
+Resampling rows with replacement only changes how many rows land in each
+(group, confusion cell), so a bootstrap replicate is one multinomial draw
+over the G×4 cell counts – O(cells) per replicate however many rows the
+test split has. Replicates are generated in fixed-size chunks, each with
+its own child seed, so results depend only on the seed (not on how many
+workers ran them); large requests fan the chunks out over the shared
+process pool (procpool).
+"""
+import os
+import warnings
+
+import numpy as np
+
+from fairness import gap, metric_from_counts
+from procpool import pmap
+
+SEED          = 0
+CHUNK         = 1_000           # replicates per task
+PARALLEL_MIN  = 20_000          # replicates below which a pool costs more than it saves
+
+
+def _replicates(metric, cells, n, seed_seq):
+    """(values[n, G], gaps[n]) for n multinomial resamples of cells[G, 4] (tp, fp, tn, fn)."""
+    total = int(cells.sum())
+    p = cells.ravel() / total if total else np.full(cells.size, 1.0 / cells.size)
+    draws = np.random.default_rng(seed_seq).multinomial(total, p, size=n)
+    draws = draws.reshape(n, *cells.shape)
+    values = metric_from_counts(metric, *(draws[..., k] for k in range(4)))
+    return values, gap(values, axis=1)
+
+
+def _run(args):
+    return _replicates(*args)
+
+
+def bootstrap(metric, tp, fp, tn, fn, n_boot=1_000, seed=SEED, workers=None):
+    """Bootstrap replicates of the per-group metric and its gap: (values[B, G], gaps[B])."""
+    cells = np.stack([tp, fp, tn, fn], axis=1).astype(np.int64)
+    sizes = [min(CHUNK, n_boot - lo) for lo in range(0, n_boot, CHUNK)]
+    tasks = [(metric, cells, n, ss)
+             for n, ss in zip(sizes, np.random.SeedSequence(seed).spawn(len(sizes)))]
+
+    workers = min(len(tasks), workers or os.cpu_count() or 1)
+    if workers > 1 and n_boot >= PARALLEL_MIN:
+        parts = pmap(_run, tasks)
+    else:
+        parts = [_run(t) for t in tasks]
+
+    if not parts:
+        return np.empty((0, len(tp))), np.empty(0)
+    return np.concatenate([v for v, _ in parts]), np.concatenate([g for _, g in parts])
+
+
+def percentile_ci(samples, level=0.95, axis=0):
+    """Percentile interval over `axis`, ignoring NaN replicates (NaN if none are defined)."""
+    alpha = (1 - level) / 2
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)      # all-NaN slices
+        lo, hi = np.nanquantile(samples, [alpha, 1 - alpha], axis=axis)
+    return lo, hi
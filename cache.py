@@ -0,0 +1,143 @@
+"""
+In-process response cache for the analytic endpoints.
+
+The routes it wraps are pure functions of their query parameters (plus the
+loaded dataset/model), so a finished JSON body can be replayed as-is.
+Entries are evicted least-recently-used once either the entry count or the
+total body size goes over budget. Every body gets a strong ETag so browsers
+revalidate with If-None-Match and get a 304 instead of the payload.
+"""
+import gzip
+import hashlib
+import threading
+from collections import OrderedDict
+from functools import wraps
+
+from flask import Response, make_response, request
+
+from instrument import note_cache, phase
+
+
+def _norm(value: str) -> str:
+    """Canonical form of one query value: '0.50' → '0.5', 'a, b,' → 'a,b'."""
+    parts = [p.strip() for p in value.split(",") if p.strip()]
+    out = []
+    for p in parts:
+        try:
+            out.append(repr(float(p)))
+        except ValueError:
+            out.append(p)
+    return ",".join(out)
+
+
+class _Entry:
+    __slots__ = ("body", "mimetype", "etag", "gzipped")
+
+    def __init__(self, body: bytes, mimetype: str, compress=False):
+        self.body     = body
+        self.mimetype = mimetype
+        self.etag     = hashlib.blake2b(body, digest_size=16).hexdigest()
+        self.gzipped  = gzip.compress(body, compresslevel=6) if compress else None
+
+    @property
+    def size(self):
+        return len(self.body) + (len(self.gzipped) if self.gzipped else 0)
+
+
+class ResponseCache:
+    """Bounded LRU of response bodies with hit/miss counters."""
+
+    def __init__(self, max_entries=512, max_bytes=256 * 2**20):
+        self.max_entries = max_entries
+        self.max_bytes   = max_bytes
+        self._entries    = OrderedDict()
+        self._bytes      = 0
+        self._lock       = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+
+    @staticmethod
+    def key(endpoint, args, scope=()):
+        """Cache key from the endpoint, its normalised query args and an extra scope."""
+        return (endpoint, tuple(scope),
+                tuple(sorted((k, _norm(v)) for k, v in args.items(multi=True))))
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, body: bytes, mimetype: str, compress=False):
+        entry = _Entry(body, mimetype, compress)
+        if entry.size > self.max_bytes:
+            return entry                     # too big to keep, still serve it
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old.size
+            self._entries[key] = entry
+            self._bytes += entry.size
+            while self._entries and (len(self._entries) > self.max_entries
+                                     or self._bytes > self.max_bytes):
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.size
+                self.evictions += 1
+        return entry
+
+    def clear(self):
+        """Drop everything – call whenever the dataset or model changes."""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return dict(
+                entries   = len(self._entries),
+                bytes     = self._bytes,
+                hits      = self.hits,
+                misses    = self.misses,
+                evictions = self.evictions,
+                hit_rate  = (self.hits / lookups) if lookups else 0.0,
+            )
+
+
+def cached_response(cache: ResponseCache, scope=lambda: (), compress=False):
+    """
+    Route decorator: serve 200 responses from `cache`, tag them with a strong
+    ETag and answer matching If-None-Match requests with 304.
+    `scope()` adds request-independent state (e.g. a model version) to the key.
+    `compress` keeps a gzip copy and sends it to clients that accept gzip.
+    """
+    def deco(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            key = cache.key(request.endpoint, request.args, scope())
+            with phase("lookup"):
+                entry = cache.get(key)
+            note_cache(entry is not None)
+            if entry is None:
+                resp = make_response(view(*args, **kwargs))
+                if resp.status_code != 200 or resp.is_streamed:
+                    return resp
+                with phase("store"):
+                    entry = cache.put(key, resp.get_data(), resp.mimetype, compress)
+
+            if entry.gzipped is not None and request.accept_encodings["gzip"]:
+                resp = Response(entry.gzipped, mimetype=entry.mimetype)
+                resp.headers["Content-Encoding"] = "gzip"
+                resp.set_etag(entry.etag + ".gz")       # distinct representation
+            else:
+                resp = Response(entry.body, mimetype=entry.mimetype)
+                resp.set_etag(entry.etag)
+            if entry.gzipped is not None:
+                resp.vary.add("Accept-Encoding")
+            resp.headers["Cache-Control"] = "no-cache"     # always revalidate
+            return resp.make_conditional(request)
+        return wrapper
+    return deco
@@ -0,0 +1,188 @@
+"""
+Array kernels for the fairness metrics served by app.py.
+
+Everything here works on plain numpy arrays (scores, 0/1 labels and
+integer group codes) so the Flask routes never have to loop over rows.
+"""
+import warnings
+
+import numpy as np
+
+METRICS = (
+    "demographic_parity",
+    "equal_opportunity",
+    "predictive_parity",
+    "predictive_equality",
+    "equalized_odds",
+    "treatment_equality",
+)
+
+
+def _div(num, den):
+    """Element-wise num/den with NaN wherever den == 0."""
+    num = np.asarray(num, dtype=float)
+    den = np.asarray(den, dtype=float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(den != 0, num / np.where(den != 0, den, 1), np.nan)
+
+
+def metric_from_counts(metric, tp, fp, tn, fn, component=None):
+    """
+    Vectorised metric value for every cell of tp/fp/tn/fn (any shape).
+    Undefined cells (zero denominators) come back as NaN.
+    `component` ('tpr' / 'fpr') splits equalized_odds into its two rates,
+    as the heatmap does.
+    """
+    tpr = lambda: _div(tp, np.add(tp, fn))
+    fpr = lambda: _div(fp, np.add(fp, tn))
+
+    if metric == "demographic_parity":  return _div(np.add(tp, fp), np.add(np.add(tp, fp), np.add(tn, fn)))
+    if metric == "equal_opportunity":   return tpr()
+    if metric == "predictive_parity":   return _div(tp, np.add(tp, fp))
+    if metric == "predictive_equality": return fpr()
+    if metric == "treatment_equality":  return _div(fn, fp)
+    if metric == "equalized_odds":
+        if component == "tpr": return tpr()
+        if component == "fpr": return fpr()
+        return np.abs(tpr() - fpr())      # NaN propagates if either is undefined
+    return np.full(np.shape(tp), np.nan)
+
+
+def metric_support(metric, tp, fp, tn, fn):
+    """Rows each metric is a rate over (its denominator), e.g. tp + fn for TPR."""
+    if metric == "equal_opportunity":   return np.add(tp, fn)
+    if metric == "predictive_parity":   return np.add(tp, fp)
+    if metric == "predictive_equality": return np.add(fp, tn)
+    if metric == "treatment_equality":  return np.add(fn, fp)
+    return np.add(np.add(tp, fp), np.add(tn, fn))
+
+
+def confusion_counts(codes, n_groups, labels, pred):
+    """
+    Per-group (tp, fp, tn, fn) in one bincount pass.
+    codes: int group code per row (negative = excluded), labels/pred: 0/1.
+    """
+    codes  = np.asarray(codes,  dtype=np.int64)
+    labels = np.asarray(labels, dtype=np.int64)
+    pred   = np.asarray(pred,   dtype=np.int64)
+
+    keep = codes >= 0
+    if not keep.all():
+        codes, labels, pred = codes[keep], labels[keep], pred[keep]
+
+    # cell index within a group: 0=TN, 1=FP, 2=FN, 3=TP
+    cells = np.bincount(codes * 4 + labels * 2 + pred, minlength=4 * n_groups)
+    cells = cells[:4 * n_groups].reshape(n_groups, 4)
+    return cells[:, 3], cells[:, 1], cells[:, 0], cells[:, 2]
+
+
+def group_metric(metric, codes, n_groups, labels, pred, component=None):
+    """Metric value per group (NaN where undefined or the group is empty)."""
+    return metric_from_counts(metric, *confusion_counts(codes, n_groups, labels, pred),
+                              component=component)
+
+
+def gap(values, axis=None):
+    """max − min over the non-NaN values (0.0 when fewer than two are defined)."""
+    vals = np.asarray(values, dtype=float)
+    if axis is None:
+        vals = vals[~np.isnan(vals)]
+        return 0.0 if vals.size < 2 else float(vals.max() - vals.min())
+
+    defined = (~np.isnan(vals)).sum(axis=axis)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)      # all-NaN slices
+        spread = np.nanmax(vals, axis=axis) - np.nanmin(vals, axis=axis)
+    return np.where(defined >= 2, spread, 0.0)
+
+
+def leave_one_out_gap(values):
+    """
+    gap() of `values` with each entry dropped in turn, in O(n): only the
+    largest/smallest two defined values matter. Dropping an undefined
+    entry leaves the gap unchanged.
+    """
+    vals = np.asarray(values, dtype=float)
+    defined = ~np.isnan(vals)
+    n_def = int(defined.sum())
+    out = np.full(vals.shape, gap(vals))
+    if n_def < 3:                                 # dropping a defined value leaves < 2
+        out[defined] = 0.0
+        return out
+
+    idx = np.flatnonzero(defined)
+    order = idx[np.argsort(vals[idx], kind="stable")]
+    lo1, lo2, hi2, hi1 = order[0], order[1], order[-2], order[-1]
+    hi = np.where(np.arange(vals.size) == hi1, vals[hi2], vals[hi1])
+    lo = np.where(np.arange(vals.size) == lo1, vals[lo2], vals[lo1])
+    out[defined] = (hi - lo)[defined]
+    return out
+
+
+# ------------------------------------------------------------------ #
+#  Threshold sweep                                                    #
+# ------------------------------------------------------------------ #
+class ThresholdSweep:
+    """
+    Scores sorted once per group with cumulative positive counts, so the
+    per-group confusion cells for *any* threshold are a binary search away.
+
+    Prediction convention matches the rest of the app: pred = score >= thr.
+    Rows with a negative code (e.g. pruned cells) are left out.
+    """
+
+    def __init__(self, scores, labels, codes, n_groups):
+        scores = np.asarray(scores, dtype=float)
+        labels = np.asarray(labels, dtype=np.int64)
+        codes  = np.asarray(codes,  dtype=np.int64)
+        keep = codes >= 0
+        if not keep.all():
+            scores, labels, codes = scores[keep], labels[keep], codes[keep]
+
+        order = np.lexsort((scores, codes))          # by group, then score
+        self.n_groups = int(n_groups)
+        self.scores   = scores[order]
+        self.offsets  = np.zeros(self.n_groups + 1, dtype=np.int64)
+        np.cumsum(np.bincount(codes, minlength=self.n_groups), out=self.offsets[1:])
+
+        self.cum_pos  = np.zeros(len(scores) + 1, dtype=np.int64)
+        np.cumsum(labels[order], out=self.cum_pos[1:])
+
+        lo, hi = self.offsets[:-1], self.offsets[1:]
+        self.size = hi - lo
+        self.pos  = self.cum_pos[hi] - self.cum_pos[lo]
+        self.distinct = np.unique(scores)
+
+    def _below(self, thr):
+        """Absolute sorted positions k[g, t]: rows of group g with score < thr[t]."""
+        thr = np.atleast_1d(np.asarray(thr, dtype=float))
+        k = np.empty((self.n_groups, thr.size), dtype=np.int64)
+        for g in range(self.n_groups):
+            lo, hi = self.offsets[g], self.offsets[g + 1]
+            k[g] = lo + np.searchsorted(self.scores[lo:hi], thr, side="left")
+        return k
+
+    def _cells(self, k):
+        lo  = self.offsets[:-1, None]
+        neg_pred = k - lo
+        fn = self.cum_pos[k] - self.cum_pos[lo]
+        tn = neg_pred - fn
+        tp = self.pos[:, None] - fn
+        fp = self.size[:, None] - neg_pred - tp
+        return tp, fp, tn, fn
+
+    def counts(self, thr):
+        """(tp, fp, tn, fn) arrays of length n_groups at a single threshold."""
+        return tuple(c[:, 0] for c in self._cells(self._below(thr)))
+
+    def curve(self, thresholds=None, max_points=None):
+        """
+        Confusion cells for many thresholds at once.
+        Defaults to every distinct score, i.e. every point where a prediction
+        flips; `max_points` evenly thins that list.
+        Returns (thresholds, tp, fp, tn, fn) with cells shaped (n_groups, T).
+        """
+        thr = self.distinct if thresholds is None else np.asarray(thresholds, dtype=float)
+        if max_points and thr.size > max_points:
+            thr = thr[np.unique(np.linspace(0, thr.size - 1, max_points).round().astype(int))]
+        return (thr, *self._cells(self._below(thr)))
@@ -0,0 +1,331 @@
+"""
+Protected-group code index.
+
+Built once at load time: integer codes plus ordered label tables for every
+protected attribute and every combination of them, so the routes never
+rebuild group labels by string concatenation per request.
+
+Intersections of any number of attributes are coded by hashing the
+(previous cell, attribute code) pairs one attribute at a time, so codes
+stay compact (only populated cells exist) and never overflow however many
+attributes are crossed. Combinations up to EAGER_ARITY attributes are
+built (and persisted) up front, wider ones on first use.
+"""
+import itertools
+import json
+import re
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+SEP   = " | "
+OTHER = "Other"         # label of the merged cell under min-support pruning
+EAGER_ARITY = 3
+PRUNED_VIEWS = 32       # min-support views (and what is derived from them) kept per index, LRU
+
+
+class ProtectedKeyError(KeyError):
+    """Protected keys that name no protected attribute, or one twice (a client error)."""
+
+
+def bucket_age(series):
+    # fixed edges: a streamed chunk buckets exactly like the full dataset
+    bins = [0, 30, np.inf]
+    labels = ["<30", "≥30"]
+    return pd.cut(series, bins=bins, labels=labels, right=False)
+
+
+def tidy_labels(series: pd.Series) -> pd.Series:
+    """Return a tidy, categorical string version suitable for the Sankey."""
+    name = series.name.lower()
+
+    # numeric Age → buckets <30, 30–49, 50+
+    if name == "age" and pd.api.types.is_numeric_dtype(series):
+        return bucket_age(series).astype(str)
+
+    # normalise capitalisation for consistency
+    if name == "gender":
+        return series.str.capitalize()         # male → Male
+    if name == "marital_status":
+        return series.str.title()              # single → Single
+
+    # fall-back
+    return series.astype(str)
+
+
+def raw_labels(series: pd.Series) -> pd.Series:
+    """Plain string version (age still bucketed) – what the heatmap shows."""
+    if series.name.lower() == "age" and pd.api.types.is_numeric_dtype(series):
+        return bucket_age(series).astype(str)
+    return series.astype(str)
+
+
+def ordered_age_labels(series):
+    """Return the distinct age-bucket strings sorted by their
+       numeric lower-bound (e.g. '<30', '30–49', '50+')."""
+    def key(label):
+        # pull first number in the string; '<30' → 0, '30–49' → 30, '50+' → 50
+        m = re.search(r"\d+", label)
+        return int(m.group()) if m else 0
+    return sorted(pd.unique(np.asarray(series)), key=key)
+
+
+class Grouping:
+    """
+    One partition of the rows into protected groups.
+      codes      – int32 group code per row
+      labels     – Sankey-style name per code
+      raw_labels – plain-string name per code (heatmap columns)
+      order      – codes in display order (what a groupby on the labels gives)
+      first_seen – codes in order of first appearance
+      sizes      – row count per code
+    """
+
+    def __init__(self, codes, labels, raw_labels, order, sizes=None, first_seen=None):
+        self.codes      = codes
+        self.labels     = labels
+        self.raw_labels = raw_labels
+        self.order      = np.asarray(order, dtype=np.int64)
+        self.n_groups   = len(labels)
+        self.sizes      = np.bincount(codes, minlength=self.n_groups) if sizes is None else sizes
+
+        if first_seen is None:
+            _, first_idx = np.unique(codes, return_index=True)
+            first_seen = np.argsort(first_idx, kind="stable")
+        self.first_seen = first_seen
+
+    def relabel(self, labels, raw_labels, order):
+        """Same partition under a different label table (e.g. attribute order)."""
+        g = object.__new__(Grouping)
+        g.__dict__.update(self.__dict__)
+        g.labels, g.raw_labels = labels, raw_labels
+        g.order = np.asarray(order, dtype=np.int64)
+        return g
+
+    def prune(self, min_support, merge=False):
+        """
+        Cells with fewer than `min_support` rows dropped (code −1) or, with
+        `merge`, pooled into one trailing OTHER cell. Kept cells keep their
+        relative order.
+        """
+        small = np.asarray(self.sizes) < min_support
+        if not small.any():
+            return self
+        keep = np.flatnonzero(~small)
+        remap = np.full(self.n_groups, -1, dtype=np.int32)
+        remap[keep] = np.arange(len(keep))
+        labels = [self.labels[i] for i in keep]
+        raw    = [self.raw_labels[i] for i in keep]
+        if merge:
+            remap[small] = len(keep)
+            labels.append(OTHER)
+            raw.append(OTHER)
+
+        mapped = remap >= 0
+        sizes = np.bincount(remap[mapped], weights=np.asarray(self.sizes)[mapped],
+                            minlength=len(labels)).astype(np.int64)
+        order = [remap[i] for i in self.order if not small[i]] + ([len(keep)] if merge else [])
+        first = remap[np.asarray(self.first_seen)]
+        first = first[first >= 0]
+        _, idx = np.unique(first, return_index=True)
+        return Grouping(remap[np.asarray(self.codes)], labels, raw, order, sizes,
+                        first[np.sort(idx)])
+
+
+class GroupIndex:
+    """
+    Codes for each key of `protected_attrs` and each combination of keys.
+    `weights` (one per row) makes group sizes weighted counts, for frames
+    whose rows stand for many records (e.g. streamed aggregates).
+    """
+
+    def __init__(self, frame: pd.DataFrame, protected_attrs: dict, weights=None):
+        self.protected_attrs = protected_attrs
+        self.n_rows = len(frame)
+        self.weights = weights
+
+        # per-attribute codes, labels kept in the attribute's display order
+        self._attr = {}
+        for key, col in protected_attrs.items():
+            tidy = tidy_labels(frame[col])
+            if col.lower() == "age":
+                uniques = ordered_age_labels(tidy)
+            else:
+                uniques = sorted(pd.unique(tidy.astype(str)))
+            codes = pd.Categorical(tidy.astype(str), categories=uniques).codes.astype(np.int32)
+
+            raw = raw_labels(frame[col]).to_numpy()
+            _, first_idx = np.unique(codes, return_index=True)
+            self._attr[key] = (codes, list(uniques), [str(raw[i]) for i in first_idx])
+
+        # every combination, keyed by keys in PROTECTED_ATTRS order
+        everyone = self._grouping(np.zeros(self.n_rows, dtype=np.int32), ["All"], ["All"], [0])
+        self._combos = {(): everyone}
+        self._cells  = {(): np.zeros((1, 0), dtype=np.int64)}
+        keys = list(protected_attrs)
+        for r in range(1, min(len(keys), EAGER_ARITY) + 1):
+            for combo in itertools.combinations(keys, r):
+                self._combos[combo], self._cells[combo] = self._build(combo)
+        self._views  = {}
+        self._pruned = OrderedDict()            # (keys, support) → pruned view, LRU
+        self._lock   = threading.Lock()
+
+    def _build(self, combo):
+        """
+        Grouping for keys in canonical order, plus its cell table
+        cells[c, j] = code of combo[j] in cell c.
+        """
+        if len(combo) == 1:
+            codes, labels, raw = self._attr[combo[0]]
+            cells = np.arange(len(labels), dtype=np.int64)[:, None]
+            return self._grouping(codes, labels, raw, cells[:, 0]), cells
+
+        # hash (cell so far, next attribute) pairs → compact ids, one attribute at a time
+        inv   = np.asarray(self._attr[combo[0]][0], dtype=np.int64)
+        cells = np.arange(len(self._attr[combo[0]][1]), dtype=np.int64)[:, None]
+        for key in combo[1:]:
+            n = len(self._attr[key][1])
+            inv, uniq = pd.factorize(inv * n + self._attr[key][0], sort=False)
+            cells = np.column_stack([cells[uniq // n], uniq % n])
+
+        # number populated cells lexicographically by attribute codes
+        rank = np.lexsort(cells.T[::-1])
+        cells = cells[rank]
+        codes = np.empty(len(rank), dtype=np.int32)
+        codes[rank] = np.arange(len(rank))
+        codes = codes[inv]
+
+        parts = self._split(combo, cells)
+        labels = self._join(combo, parts, 1)
+        raw    = self._join(combo, parts, 2)
+        return self._grouping(codes, labels, raw, _string_order(labels)), cells
+
+    def _grouping(self, codes, labels, raw, order):
+        sizes = None
+        if self.weights is not None:
+            sizes = np.bincount(codes, weights=self.weights, minlength=len(labels)).astype(np.int64)
+        return Grouping(codes, labels, raw, order, sizes)
+
+    def _split(self, combo, cells):
+        """Cell table → per-attribute codes, one array per key."""
+        return {key: cells[:, j] for j, key in enumerate(combo)}
+
+    def _join(self, keys, parts, which):
+        tables = [self._attr[k][which] for k in keys]
+        return [SEP.join(t[i] for t, i in zip(tables, ix))
+                for ix in zip(*(parts[k] for k in keys))]
+
+    # -------------------------------------------------------------- #
+    #  Persistence: label tables as JSON, arrays as .npy (mmap-able)  #
+    # -------------------------------------------------------------- #
+    def save(self, path):
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        meta = {"protected_attrs": self.protected_attrs, "n_rows": self.n_rows,
+                "attrs": {k: [u, r] for k, (_, u, r) in self._attr.items()},
+                "combos": []}
+        for combo, g in self._combos.items():
+            name = "+".join(combo) or "_all"
+            for field in ("codes", "sizes", "first_seen"):
+                np.save(path / f"{name}.{field}.npy", getattr(g, field))
+            np.save(path / f"{name}.cells.npy", self._cells[combo])
+            meta["combos"].append({"keys": list(combo), "name": name, "labels": g.labels,
+                                   "raw_labels": g.raw_labels, "order": g.order.tolist()})
+        (path / "groups.json").write_text(json.dumps(meta))
+
+    @classmethod
+    def load(cls, path, mmap_mode="r"):
+        """Rebuild an index written by save(); code arrays are memory-mapped."""
+        path = Path(path)
+        meta = json.loads((path / "groups.json").read_text())
+        self = object.__new__(cls)
+        self.protected_attrs = meta["protected_attrs"]
+        self.n_rows = meta["n_rows"]
+        self.weights = None
+        self._combos, self._cells, self._views, self._attr = {}, {}, {}, {}
+        self._pruned, self._lock = OrderedDict(), threading.Lock()
+
+        arr = lambda name, field: np.load(path / f"{name}.{field}.npy", mmap_mode=mmap_mode)
+        for c in meta["combos"]:
+            combo, name = tuple(c["keys"]), c["name"]
+            self._combos[combo] = Grouping(arr(name, "codes"), c["labels"], c["raw_labels"],
+                                           c["order"], arr(name, "sizes"), arr(name, "first_seen"))
+            self._cells[combo] = arr(name, "cells")
+        for key, (uniques, raw) in meta["attrs"].items():
+            self._attr[key] = (self._combos[(key,)].codes, uniques, raw)
+        return self
+
+    def grouping(self, keys, support=None) -> Grouping:
+        """
+        Grouping for protected keys in the requested order (e.g. ['gender', 'age']).
+        `support` = (min_support, merge) prunes cells smaller than min_support
+        (see Grouping.prune).
+        """
+        keys = tuple(keys)
+        canon = tuple(k for k in self.protected_attrs if k in keys)
+        if len(canon) != len(keys):
+            raise ProtectedKeyError(f"unknown or repeated protected keys: {list(keys)}")
+        if canon not in self._combos:                 # wider than EAGER_ARITY
+            self._combos[canon], self._cells[canon] = self._build(canon)
+
+        if keys == canon:
+            view = self._combos[canon]
+        else:
+            # same partition, labels joined in the requested attribute order
+            if keys not in self._views:
+                base   = self._combos[canon]
+                parts  = self._split(canon, self._cells[canon])
+                labels = self._join(keys, parts, 1)
+                raw    = self._join(keys, parts, 2)
+                self._views[keys] = base.relabel(labels, raw, _string_order(labels))
+            view = self._views[keys]
+
+        support = _canonical_support(view.sizes, support)
+        if support is None:
+            return view
+        with self._lock:
+            pruned = self._pruned.pop((keys, support), None)
+        if pruned is None:
+            pruned = view.prune(*support)
+        with self._lock:
+            self._pruned[keys, support] = pruned
+            while len(self._pruned) > PRUNED_VIEWS:
+                self._pruned.popitem(last=False)
+        return pruned
+
+    def support_key(self, keys, support):
+        """
+        Canonical form of `support` for `keys` (see _canonical_support), for
+        callers caching what they derive from a pruned grouping.
+        """
+        return _canonical_support(self.grouping(keys).sizes, support)
+
+    @property
+    def pruned_nbytes(self):
+        """Bytes held by the cached min-support views."""
+        with self._lock:
+            return sum(g.codes.nbytes for g in self._pruned.values())
+
+
+def _canonical_support(sizes, support):
+    """
+    `support` = (min_support, merge) reduced to what it does to cells of
+    `sizes`: None when nothing is pruned, else min_support raised to the
+    smallest kept cell (one past the largest when every cell goes), so all
+    ?min_support= values pruning the same cells share one cache key.
+    """
+    if not support or not support[0]:
+        return None
+    sizes = np.asarray(sizes)
+    small = sizes < support[0]
+    if not small.any():
+        return None
+    n = sizes[~small].min() if not small.all() else sizes.max() + 1
+    return int(n), bool(support[1])
+
+
+def _string_order(labels):
+    return sorted(range(len(labels)), key=labels.__getitem__)
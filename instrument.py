@@ -0,0 +1,181 @@
+"""
+Request-phase instrumentation.
+
+Routes wrap their hot sections in `with phase("name"):`. Each request's
+phases (plus JSON serialisation, timed in the JSON provider) are sent
+back in a `Server-Timing` header that browser devtools display, and are
+folded into per-endpoint counters served as Prometheus text by /metrics:
+latency and payload-size histograms, time per phase, rows processed and
+response-cache hits/misses.
+
+When disabled, `phase()` returns one shared no-op context manager and the
+request hooks are never registered, so the cost is a function call.
+"""
+import bisect
+import contextlib
+import numbers
+import threading
+import time
+from collections import defaultdict
+
+from flask import g, has_request_context, request
+from flask.json.provider import DefaultJSONProvider
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS    = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+_enabled = False
+_NOOP    = contextlib.nullcontext()
+
+
+class _Phase:
+    __slots__ = ("name", "t0")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+
+    def __exit__(self, *exc):
+        phases = g.setdefault("phases", {})
+        phases[self.name] = phases.get(self.name, 0.0) + time.perf_counter() - self.t0
+
+
+def phase(name):
+    """Context manager timing one phase of the current request (no-op when disabled)."""
+    return _Phase(name) if _enabled and has_request_context() else _NOOP
+
+
+def note_rows(n):
+    """Rows the current request works over (e.g. the test split size)."""
+    if _enabled and has_request_context():
+        g.rows = n
+
+
+def note_cache(hit):
+    if _enabled and has_request_context():
+        g.cache_hit = hit
+
+
+def _num(v):
+    """Sample value: integers exactly, floats at full precision (rate() sees every step)."""
+    if isinstance(v, numbers.Integral):
+        return str(int(v))
+    return repr(float(v))
+
+
+class _Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts  = [0] * (len(buckets) + 1)
+        self.sum     = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def lines(self, name, labels):
+        out, acc = [], 0
+        for le, c in zip(list(self.buckets) + ["+Inf"], self.counts):
+            acc += c
+            out.append(f'{name}_bucket{{{labels},le="{le}"}} {acc}')
+        out.append(f"{name}_sum{{{labels}}} {_num(self.sum)}")
+        out.append(f"{name}_count{{{labels}}} {acc}")
+        return out
+
+
+class Metrics:
+    """Per-endpoint counters behind /metrics."""
+
+    def __init__(self):
+        self._lock    = threading.Lock()
+        self.latency  = defaultdict(lambda: _Histogram(LATENCY_BUCKETS))
+        self.size     = defaultdict(lambda: _Histogram(SIZE_BUCKETS))
+        self.phases   = defaultdict(float)                  # (endpoint, phase) → seconds
+        self.rows     = defaultdict(int)
+        self.cache    = defaultdict(int)                    # (endpoint, "hit"|"miss") → count
+        self.status   = defaultdict(int)                    # (endpoint, code) → count
+
+    def record(self, endpoint, status, seconds, nbytes, phases, rows, cache_hit):
+        with self._lock:
+            self.latency[endpoint].observe(seconds)
+            if nbytes is not None:
+                self.size[endpoint].observe(nbytes)
+            for name, secs in phases.items():
+                self.phases[endpoint, name] += secs
+            if rows:
+                self.rows[endpoint] += rows
+            if cache_hit is not None:
+                self.cache[endpoint, "hit" if cache_hit else "miss"] += 1
+            self.status[endpoint, status] += 1
+
+    def render(self, cache_stats=None):
+        """Prometheus text exposition format."""
+        with self._lock:
+            out = ["# TYPE fairness_request_duration_seconds histogram"]
+            for ep, h in sorted(self.latency.items()):
+                out += h.lines("fairness_request_duration_seconds", f'endpoint="{ep}"')
+            out.append("# TYPE fairness_response_bytes histogram")
+            for ep, h in sorted(self.size.items()):
+                out += h.lines("fairness_response_bytes", f'endpoint="{ep}"')
+            out.append("# TYPE fairness_requests_total counter")
+            out += [f'fairness_requests_total{{endpoint="{ep}",status="{s}"}} {n}'
+                    for (ep, s), n in sorted(self.status.items())]
+            out.append("# TYPE fairness_phase_seconds_total counter")
+            out += [f'fairness_phase_seconds_total{{endpoint="{ep}",phase="{p}"}} {_num(s)}'
+                    for (ep, p), s in sorted(self.phases.items())]
+            out.append("# TYPE fairness_rows_processed_total counter")
+            out += [f'fairness_rows_processed_total{{endpoint="{ep}"}} {n}'
+                    for ep, n in sorted(self.rows.items())]
+            out.append("# TYPE fairness_cache_requests_total counter")
+            out += [f'fairness_cache_requests_total{{endpoint="{ep}",result="{r}"}} {n}'
+                    for (ep, r), n in sorted(self.cache.items())]
+        if cache_stats:
+            for key, kind in (("entries", "gauge"), ("bytes", "gauge"), ("hits", "counter"),
+                              ("misses", "counter"), ("evictions", "counter"), ("hit_rate", "gauge")):
+                out.append(f"# TYPE fairness_cache_{key} {kind}")
+                out.append(f"fairness_cache_{key} {_num(cache_stats[key])}")
+        return "\n".join(out) + "\n"
+
+
+METRICS = Metrics()
+
+
+class TimedJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider that books serialisation time as the 'json' phase."""
+
+    def dumps(self, obj, **kwargs):
+        with phase("json"):
+            return super().dumps(obj, **kwargs)
+
+
+def _before():
+    g.t0 = time.perf_counter()
+
+
+def _after(resp):
+    elapsed = time.perf_counter() - g.get("t0", time.perf_counter())
+    phases = g.get("phases", {})
+    timing = [f"{name};dur={secs * 1e3:.2f}" for name, secs in phases.items()]
+    cache_hit = g.get("cache_hit")
+    if cache_hit is not None:
+        timing.append(f'cache;desc="{"hit" if cache_hit else "miss"}"')
+    timing.append(f"total;dur={elapsed * 1e3:.2f}")
+    resp.headers["Server-Timing"] = ", ".join(timing)
+
+    nbytes = None if resp.is_streamed else resp.calculate_content_length()
+    METRICS.record(request.endpoint or "unknown", resp.status_code, elapsed, nbytes,
+                   phases, g.get("rows"), cache_hit)
+    return resp
+
+
+def init_app(app, enabled=True):
+    """Turn instrumentation on for `app` (or leave everything a no-op)."""
+    global _enabled
+    _enabled = enabled
+    if not enabled:
+        return
+    app.json = TimedJSONProvider(app)
+    app.before_request(_before)
+    app.after_request(_after)
@@ -0,0 +1,272 @@
+"""
+Background retraining jobs.
+
+A job retrains one (dataset, model) under a new config – split source,
+LogisticRegression settings, class weighting, optional k-fold evaluation –
+in a worker process, so request threads never wait on scikit-learn. The
+worker records when each build stage starts in a small JSON file, which
+the status endpoint reads. Once the artifact is written, the registry loads
+and warms the new entry and swaps it in (Registry.swap); response-cache
+entries are scoped by artifact version, so no stale body is served.
+
+Job records and swaps are also written under JOB_DIR, so that with several
+server processes (serve.py) any of them can report a job, and each swaps
+the new model in before its next request (JobManager.sync).
+"""
+import json
+import multiprocessing
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import artifacts
+
+JOB_DIR  = artifacts.ARTIFACT_ROOT / "jobs"
+SWAP_DIR = JOB_DIR / "swaps"               # (dataset, model) → params it was last swapped to
+
+# config keys a job may set on top of the model's current params
+CONFIG_KEYS = ("test_size", "random_state", "split_column", "max_iter", "solver",
+               "class_weight", *artifacts.LOGREG_EXTRA)
+# config keys that only shape this run, never the model's params
+RUN_KEYS = ("cv",)
+
+
+def _run(progress_path, csv, target, params, protected, positive, cv):
+    """Worker process: build (or reuse) the artifact; (artifact version, stage start times)."""
+    stages = {}
+
+    def progress(stage):
+        stages[stage] = time.time()
+        tmp = progress_path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(stages))
+        tmp.replace(progress_path)
+
+    art = artifacts.load_or_build(csv, target, params, protected, positive, progress=progress, cv=cv)
+    return art.path.name, stages
+
+
+class Job:
+    """One retrain request and what is known about it so far."""
+
+    def __init__(self, dataset, model, params, folds=None):
+        self.id        = uuid.uuid4().hex[:12]
+        self.dataset   = dataset
+        self.model     = model
+        self.params    = params
+        self.folds     = folds                  # k-fold evaluation requested, or None
+        self.state     = "queued"               # queued → running → done | failed
+        self.stages    = {}                     # stage → start time
+        self.submitted = time.time()
+        self.finished  = None
+        self.version   = None
+        self.cv        = None
+        self.error     = None
+
+    @property
+    def progress_path(self):
+        return JOB_DIR / f"{self.id}.json"
+
+    @property
+    def record_path(self):
+        return JOB_DIR / f"{self.id}.status.json"
+
+    def save(self):
+        """Write the job's record for the other server processes."""
+        tmp = self.record_path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(vars(self)))
+        tmp.replace(self.record_path)
+
+    @classmethod
+    def load(cls, path):
+        """Job from a record written by save(), or None if there is none."""
+        try:
+            fields = json.loads(path.read_text())
+        except (OSError, ValueError):
+            return None
+        job = object.__new__(cls)
+        vars(job).update(fields)
+        return job
+
+    def status(self):
+        stages = self.stages
+        if self.state in ("queued", "running") and self.progress_path.exists():
+            try:
+                stages = {**json.loads(self.progress_path.read_text()), **stages}
+            except (OSError, ValueError):               # replaced mid-read
+                pass
+        state = "running" if self.state == "queued" and stages else self.state
+
+        order = sorted(stages, key=stages.get)
+        ends = [stages[s] for s in order[1:]] + [self.finished or time.time()]
+        end = self.finished or time.time()
+        return dict(
+            id        = self.id,
+            dataset   = self.dataset,
+            model     = self.model,
+            params    = self.params,
+            folds     = self.folds,
+            state     = state,
+            stage     = order[-1] if order and state == "running" else None,
+            timings   = {s: round(e - stages[s], 3) for s, e in zip(order, ends)},
+            queued_s  = round((stages[order[0]] if order else end) - self.submitted, 3),
+            elapsed_s = round(end - self.submitted, 3),
+            version   = self.version,
+            cv        = self.cv,
+            error     = self.error,
+        )
+
+
+class JobManager:
+    """Runs retrain jobs on a process pool and swaps finished models into the registry."""
+
+    def __init__(self, registry, workers=1, on_swap=None):
+        self.registry = registry
+        self.workers  = workers
+        self.on_swap  = on_swap                  # callback() after each swap
+        self.jobs     = {}
+        self.started  = time.time()              # records from earlier runs are ignored
+        self._pool    = None
+        self._lock    = threading.Lock()
+        self._seen    = None                     # SWAP_DIR mtime last synced
+        self._sync_lock = threading.Lock()
+
+    def submit(self, dataset=None, model=None, config=None) -> Job:
+        """Queue a retrain of (dataset, model) with `config` overriding its params."""
+        dataset, model = self.registry.resolve(dataset, model)
+        config = dict(config or {})
+        unknown = sorted(set(config) - set(CONFIG_KEYS) - set(RUN_KEYS))
+        if unknown:
+            raise ValueError(f"unknown config key(s): {', '.join(unknown)}")
+        if "cv" in config and (not isinstance(config["cv"], int) or config["cv"] < 2):
+            raise ValueError("cv must be an integer >= 2")
+
+        folds = config.pop("cv", None)
+        spec = self.registry.specs[dataset]
+        params = {k: v for k, v in {**spec["models"][model], **config}.items() if k not in RUN_KEYS}
+        job = Job(dataset, model, params, folds)
+        JOB_DIR.mkdir(parents=True, exist_ok=True)
+        args = (_run, job.progress_path, spec["csv"], spec["target"], params,
+                spec["protected"], spec["positive"], folds)
+        job.save()
+        with self._lock:
+            self.jobs[job.id] = job
+            for _ in range(2):            # a pool broken by a dead worker is replaced once
+                pool = self._get_pool()
+                try:
+                    future = pool.submit(*args)
+                    break
+                except BrokenProcessPool:
+                    self._drop_pool(pool)
+            else:
+                job.state, job.error, job.finished = "failed", "retrain worker pool is broken", time.time()
+                job.save()
+                return job
+        future.add_done_callback(lambda f: self._finish(job, f, pool))
+        return job
+
+    def _get_pool(self):
+        """The shared worker pool, created on first use. Caller holds the lock."""
+        if self._pool is None:
+            # spawn: never fork a process whose request threads may hold locks
+            self._pool = ProcessPoolExecutor(self.workers,
+                                             mp_context=multiprocessing.get_context("spawn"))
+        return self._pool
+
+    def _drop_pool(self, pool):
+        """Forget a broken pool so the next submit starts a fresh one. Caller holds the lock."""
+        if self._pool is pool:
+            self._pool = None
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def _finish(self, job, future, pool):
+        """Pool callback thread: swap the new model in (or record the failure)."""
+        try:
+            job.version, stages = future.result()
+            job.stages = {**stages, "swap": time.time()}
+            entry = self.registry.swap(job.dataset, job.model, job.params)
+            self._publish(job)
+            job.cv = entry.artifact.meta.get("cv") if job.folds else None
+            if self.on_swap:
+                self.on_swap()
+            job.state = "done"
+        except BrokenProcessPool:
+            with self._lock:
+                self._drop_pool(pool)
+            job.error = "retrain worker died"
+            job.state = "failed"
+        except Exception as e:
+            job.error = str(e) or type(e).__name__
+            job.state = "failed"
+        finally:
+            job.finished = time.time()
+            job.save()
+            job.progress_path.unlink(missing_ok=True)
+
+    def _publish(self, job):
+        """Record the swap for the other server processes (see sync)."""
+        SWAP_DIR.mkdir(parents=True, exist_ok=True)
+        path = SWAP_DIR / f"{job.dataset}--{job.model}.json"
+        tmp = path.with_name(f"{job.id}.tmp")
+        tmp.write_text(json.dumps(dict(dataset=job.dataset, model=job.model,
+                                       params=job.params, at=time.time())))
+        tmp.replace(path)
+
+    def sync(self):
+        """
+        Swap in models another server process retrained and published since
+        this one last looked. Costs one stat() when nothing changed.
+        """
+        try:
+            stamp = SWAP_DIR.stat().st_mtime_ns
+        except FileNotFoundError:
+            return
+        if stamp == self._seen:
+            return
+        swapped = False
+        with self._sync_lock:
+            if stamp == self._seen:
+                return
+            for path in SWAP_DIR.glob("*.json"):
+                try:
+                    swap = json.loads(path.read_text())
+                except (OSError, ValueError):               # replaced mid-read; next stamp
+                    continue
+                spec = self.registry.specs.get(swap["dataset"])
+                if (swap["at"] < self.started or spec is None or swap["model"] not in spec["models"]
+                        or json.loads(json.dumps(spec["models"][swap["model"]])) == swap["params"]):
+                    continue
+                try:
+                    self.registry.swap(swap["dataset"], swap["model"], swap["params"])
+                    swapped = True
+                except Exception as e:
+                    print(f"swap of {swap['dataset']}/{swap['model']} failed: {e}",
+                          file=sys.stderr, flush=True)
+            # mtimes are coarse: a publish in the same tick as this scan keeps the stamp,
+            # so only trust stamps that are a second old
+            self._seen = stamp if time.time_ns() - stamp > 1_000_000_000 else None
+        if swapped and self.on_swap:
+            self.on_swap()
+
+    def get(self, job_id):
+        """The job, from its record if another server process accepted it; None if unknown."""
+        with self._lock:
+            job = self.jobs.get(job_id)
+        if job is None and job_id.isalnum():
+            job = Job.load(JOB_DIR / f"{job_id}.status.json")
+            if job is not None and job.submitted < self.started:
+                job = None
+        return job
+
+    def list(self):
+        """Every job since this server started, whichever process accepted it, oldest first."""
+        with self._lock:
+            jobs = dict(self.jobs)
+        for path in JOB_DIR.glob("*.status.json"):
+            job_id = path.name.split(".")[0]
+            job = jobs.get(job_id) or Job.load(path)
+            if job is not None and job.submitted >= self.started:
+                jobs[job_id] = job
+        return sorted(jobs.values(), key=lambda job: job.submitted)
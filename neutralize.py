@@ -0,0 +1,121 @@
+"""
+Server-side feature neutralization, batched over every feature.
+
+Neutralizing a feature aligns its distribution across the protected groups
+with the pooled distribution, the same way the dashboard does it:
+
+  * numeric     – quantile mapping, x' = F_pooled⁻¹(F_group(x))
+  * categorical – each group gets round(p_pooled · n_group) rows of every
+                  value, assigned in a (seeded) random order
+
+The neutralized column is re-scored through Rescorer (a logit delta for the
+linear pipeline) and reduced to per-group confusion counts. Features are
+independent, so large test splits fan them out over the shared process
+pool (procpool), one batch of features per worker.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+from fairness import confusion_counts
+from procpool import pmap
+
+SEED              = 0
+PARALLEL_MIN_ROWS = 200_000     # below this a pool costs more than it saves
+
+
+def align_numeric(values, codes):
+    """Quantile-map each group's values onto the pooled distribution."""
+    x = np.asarray(values, dtype=float)
+    out = x.copy()
+    keep = (codes >= 0) & np.isfinite(x)
+    if not keep.any():
+        return out
+    xs_all, cs_all = x[keep], codes[keep]
+
+    # F_group(x) = (# values in the group ≤ x) / n_group, via one sort by (group, x)
+    s = np.lexsort((xs_all, cs_all))
+    xs, cs = xs_all[s], cs_all[s]
+    new_run = np.r_[True, (xs[1:] != xs[:-1]) | (cs[1:] != cs[:-1])]
+    run_end = np.r_[np.flatnonzero(new_run)[1:], len(xs)]
+    end = run_end[np.cumsum(new_run) - 1]
+    size = np.bincount(cs)
+    start = np.r_[0, np.cumsum(size)[:-1]]
+    u = np.empty(len(xs))
+    u[s] = (end - start[cs]) / size[cs]
+
+    out[keep] = np.quantile(xs_all, u)            # linear interpolation, like the client
+    return out
+
+
+def align_categorical(values, codes, rng):
+    """Reassign each group's values so its value shares match the pooled shares."""
+    out = np.asarray(values, dtype=object).copy()
+    keep = (codes >= 0) & pd.notna(out)
+    if not keep.any():
+        return out
+    inv, uniq = pd.factorize(out[keep])
+    share = np.bincount(inv) / keep.sum()
+
+    rows = np.flatnonzero(keep)
+    for g in np.unique(codes[keep]):
+        members = rows[codes[rows] == g]
+        want = np.floor(share * len(members) + 0.5).astype(np.int64)
+        want[0] = max(0, want[0] + len(members) - want.sum())   # rounding slack → first value
+        new = np.repeat(uniq, want)
+        rng.shuffle(new)
+        m = min(len(members), len(new))
+        out[members[:m]] = new[:m]
+    return out
+
+
+class _Job:
+    """Everything one feature's what-if needs; shipped with each worker's batch."""
+
+    def __init__(self, rescorer, numeric, codes, n_groups, labels, thr, seed):
+        self.rescorer = rescorer
+        self.numeric  = set(numeric)
+        self.codes    = np.asarray(codes)
+        self.n_groups = n_groups
+        self.labels   = np.asarray(labels)
+        self.thr      = thr
+        self.seed     = seed
+
+    def __call__(self, item):
+        i, feature = item
+        col = self.rescorer.X_test[feature].to_numpy()
+        if feature in self.numeric:
+            new = align_numeric(col, self.codes)
+        else:
+            new = align_categorical(col, self.codes, np.random.default_rng([self.seed, i]))
+        ids = np.arange(len(col))
+        scores = self.rescorer.rescore(ids, {feature: new})
+        return np.stack(confusion_counts(self.codes, self.n_groups, self.labels,
+                                         (scores >= self.thr).astype(int)))
+
+
+def _run(task):
+    job, items = task
+    return [job(item) for item in items]
+
+
+def neutralized_counts(rescorer, features, numeric, codes, n_groups, labels, thr,
+                       seed=SEED, workers=None):
+    """
+    Confusion counts after neutralizing each feature on its own.
+    Returns an int array shaped (features, 4, groups) holding tp, fp, tn, fn.
+    """
+    job = _Job(rescorer, numeric, codes, n_groups, labels, thr, seed)
+    items = list(enumerate(features))
+    workers = min(len(items), workers or os.cpu_count() or 1)
+
+    if workers > 1 and len(codes) >= PARALLEL_MIN_ROWS:
+        batches = [(job, items[w::workers]) for w in range(workers)]
+        parts = pmap(_run, batches)
+        counts = [None] * len(items)
+        for w, part in enumerate(parts):
+            counts[w::workers] = part
+    else:
+        counts = [job(item) for item in items]
+    return np.stack(counts) if counts else np.zeros((0, 4, n_groups), dtype=np.int64)
@@ -0,0 +1,158 @@
+"""
+Threshold search for a small fairness gap at the best accuracy.
+
+Everything works on the confusion cells a sweep yields for a grid of
+candidate thresholds – cells[g, t] for every group g and threshold t, all
+from the scores sorted once – so no threshold is probed by re-scoring.
+
+  global     one threshold for everyone: every candidate is evaluated.
+  per_group  one threshold per group. A solution with gap ≤ ε has every
+             group's metric inside a band [v, v + ε] whose edges are values
+             some group reaches, so for each such band the best solution
+             takes, per group, the most accurate threshold whose metric
+             falls in it: a range-max query over that group's candidates
+             sorted by metric value. Every band is tried while that fits
+             BAND_BUDGET (exact on the candidate grid); past it, each lower
+             edge gets EPS_STEPS widths from quantiles of the value spreads.
+
+A candidate counts only where the metric is defined for at least two
+groups (one group when there is only one): gap() is 0 for fewer, which
+would otherwise make thresholds that leave the metric undefined look
+perfectly fair.
+
+Selection-rate bounds don't split over groups; they are handled Lagrangian
+style, by also maximizing accuracy + λ·selection rate for a few λ and
+keeping the candidates inside the bounds. The Pareto frontier is taken
+over every candidate that meets the constraints.
+"""
+import numpy as np
+
+from fairness import gap, metric_from_counts
+
+BAND_BUDGET = 4_000_000                         # band queries × groups searched exhaustively
+EPS_STEPS   = 32                                # band widths per lower edge beyond that budget
+LAMBDAS   = (0.0, -0.05, 0.05, -0.2, 0.2, -1.0, 1.0)
+
+
+class _RangeArgmax:
+    """Sparse table over `values`: argmax on [lo, hi) in O(1) per query."""
+
+    def __init__(self, values):
+        self.values = values
+        n = len(values)
+        levels = [np.arange(n)]
+        while 2 ** len(levels) <= n:
+            half = 2 ** (len(levels) - 1)
+            prev = levels[-1]
+            a, b = prev[:n - 2 * half + 1], prev[half:n - half + 1]
+            levels.append(np.where(values[b] > values[a], b, a))
+        self.table = np.zeros((len(levels), n), dtype=np.int64)
+        for k, lvl in enumerate(levels):
+            self.table[k, :len(lvl)] = lvl
+
+    def query(self, lo, hi):
+        """argmax positions for arrays of bounds with hi > lo."""
+        k = np.log2(hi - lo).astype(np.int64)
+        a, b = self.table[k, lo], self.table[k, hi - 2 ** k]
+        return np.where(self.values[b] > self.values[a], b, a)
+
+
+def _bands(pool, n_groups):
+    """(lower, upper) edges of the value bands to search."""
+    P = pool.size
+    if P * (P + 1) // 2 * n_groups <= BAND_BUDGET:
+        i, j = np.triu_indices(P)
+        return pool[i], pool[j]
+    rng = np.random.default_rng(0)
+    spread = np.abs(pool[rng.integers(0, P, 100_000)] - pool[rng.integers(0, P, 100_000)])
+    eps = np.unique(np.append(np.quantile(spread, np.linspace(0, 1, EPS_STEPS)), 0.0))
+    return np.repeat(pool, eps.size), np.repeat(pool, eps.size) + np.tile(eps, P)
+
+
+def _band_choices(values, objective):
+    """
+    Per-group threshold indices [C, G] of the best band solutions: for every
+    band [lo, hi], each group's highest-objective candidate with
+    lo <= value <= hi. Groups whose metric is never defined are free.
+    """
+    G, T = values.shape
+    defined = ~np.isnan(values)
+    pool = np.unique(values[defined])
+    if pool.size == 0:
+        return np.argmax(objective, axis=1)[None, :]
+    lo_edge, hi_edge = _bands(pool, G)
+    hi_edge = hi_edge + 1e-12
+
+    choice = np.empty((lo_edge.size, G), dtype=np.int64)
+    feasible = np.ones(lo_edge.size, dtype=bool)
+    for g in range(G):
+        cand = np.flatnonzero(defined[g])
+        if not cand.size:                       # metric undefined for this group: it can't widen the gap
+            choice[:, g] = np.argmax(objective[g])
+            continue
+        order = cand[np.argsort(values[g, cand], kind="stable")]
+        sorted_vals = values[g, order]
+        lo = np.searchsorted(sorted_vals, lo_edge, side="left")
+        hi = np.searchsorted(sorted_vals, hi_edge, side="right")
+        ok = hi > lo
+        feasible &= ok
+        pos = _RangeArgmax(objective[g, order]).query(lo[ok], hi[ok])
+        choice[ok, g] = order[pos]
+    return np.unique(choice[feasible], axis=0)
+
+
+def evaluate(metric, tp, fp, tn, fn, choice):
+    """(values[C, G], gap[C], accuracy[C], selection rate[C]) for threshold indices choice[C, G]."""
+    rows = np.arange(tp.shape[0])
+    tp, fp, tn, fn = (c[rows, choice] for c in (tp, fp, tn, fn))
+    n = (tp + fp + tn + fn).sum(axis=1)
+    n = np.where(n, n, 1)
+    values = metric_from_counts(metric, tp, fp, tn, fn)
+    return values, gap(values, axis=1), (tp + tn).sum(axis=1) / n, (tp + fp).sum(axis=1) / n
+
+
+def pareto(gaps, accuracy):
+    """Indices of the candidates no other beats on both gap (lower) and accuracy (higher), by gap."""
+    order = np.lexsort((-accuracy, gaps))
+    keep, best = [], -np.inf
+    for i in order:
+        if accuracy[i] > best:
+            keep.append(i)
+            best = accuracy[i]
+    return np.asarray(keep, dtype=np.int64)
+
+
+def optimize(metric, tp, fp, tn, fn, mode="per_group", min_accuracy=None,
+             min_selection=None, max_selection=None):
+    """
+    Search thresholds over cells shaped [G, T] (one column per candidate threshold).
+    Returns (choice[C, G], values, gaps, accuracy, selection, frontier, best):
+    every comparable candidate meeting the constraints, the indices of its Pareto
+    frontier and of the lowest-gap (then most accurate) one, or best=None
+    when nothing meets the constraints.
+    """
+    G, T = tp.shape
+    total = max(int((tp[:, 0] + fp[:, 0] + tn[:, 0] + fn[:, 0]).sum()), 1) if T else 1
+
+    choice = np.repeat(np.arange(T)[:, None], G, axis=1)         # one shared threshold
+    if mode != "global":
+        values = metric_from_counts(metric, tp, fp, tn, fn)
+        lambdas = LAMBDAS if min_selection is not None or max_selection is not None else (0.0,)
+        # objective per group and threshold, in units of overall accuracy / selection rate
+        parts = [_band_choices(values, ((tp + tn) + lam * (tp + fp)) / total) for lam in lambdas]
+        choice = np.unique(np.concatenate([choice, *parts]), axis=0)
+
+    values, gaps, accuracy, selection = evaluate(metric, tp, fp, tn, fn, choice)
+    gaps = gaps.round(12)                                      # equal gaps tie on accuracy
+    ok = (~np.isnan(values)).sum(axis=1) >= min(2, G)          # a gap needs groups to compare
+    if min_accuracy is not None:
+        ok &= accuracy >= min_accuracy
+    if min_selection is not None:
+        ok &= selection >= min_selection
+    if max_selection is not None:
+        ok &= selection <= max_selection
+
+    choice, values, gaps, accuracy, selection = (a[ok] for a in (choice, values, gaps, accuracy, selection))
+    frontier = pareto(gaps, accuracy)
+    best = int(frontier[0]) if frontier.size else None
+    return choice, values, gaps, accuracy, selection, frontier, best
@@ -0,0 +1,48 @@
+"""
+Shared worker-process pool for request handlers.
+
+Routes that fan work out over processes share one lazily created pool
+instead of starting a pool per request. It uses the spawn start method:
+forking a threaded server copies locks other request threads hold (and
+BLAS thread-pool state) into the child, where nothing ever releases them.
+Spawned workers start empty, so every task carries what it needs; a pool
+broken by a dead worker is replaced on the next call.
+"""
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+WORKERS = os.cpu_count() or 1
+
+_pool = None
+_lock = threading.Lock()
+
+
+def _get():
+    global _pool
+    with _lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def _drop(pool):
+    global _pool
+    with _lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def pmap(fn, items):
+    """list(map(fn, items)) on the shared pool, in order; retried once on a fresh pool if it broke."""
+    for attempt in range(2):
+        pool = _get()
+        try:
+            return list(pool.map(fn, items))
+        except BrokenProcessPool:
+            _drop(pool)
+            if attempt:
+                raise
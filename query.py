@@ -0,0 +1,150 @@
+"""
+Row filters answered from column indexes (brushing / neutralization scope).
+
+Each categorical column keeps one packed bitmap per value, and each numeric
+column (plus the score) its row order sorted by value. A filter – ranges
+on numeric columns, value sets on categorical ones – is then a couple of
+binary searches per range and a few bitmap ORs / ANDs, and the per-group
+confusion counts of the matching rows are popcounts of
+filter ∧ group ∧ outcome bitmaps. No row ever leaves the server.
+
+A range's binary searches give its row count up front: narrow ranges set
+their rows from the sorted order, wide ones (where scattering that many
+row ids costs more than a sequential pass) compare the column directly.
+"""
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from slices import pack, popcount
+
+SCATTER_MAX = 1 / 16            # widest range (share of rows) set from the sorted order
+PRED_CACHE  = 16                # prediction bitmaps kept (brushing keeps the threshold fixed)
+GROUP_CACHE = 16                # group bitmap sets kept, one per (protected keys, support)
+
+
+def _bound(col, v):
+    """A range bound as a finite float (None = open); ValueError otherwise."""
+    if v is None:
+        return None
+    try:
+        v = float(v)
+    except (TypeError, ValueError):
+        raise ValueError(f"'{col}' range bounds must be numbers or null") from None
+    if not np.isfinite(v):
+        raise ValueError(f"'{col}' range bounds must be finite")
+    return v
+
+
+class RowIndex:
+    """Sorted numeric columns and per-value bitmaps over the test split."""
+
+    def __init__(self, frame: pd.DataFrame, scores, labels):
+        self.n_rows  = len(frame)
+        self.numeric = {}                       # column → (values, sorted values, row order)
+        self.values  = {}                       # column → {value: bitmap}
+        for c in frame.columns:
+            col = frame[c]
+            if pd.api.types.is_numeric_dtype(col):
+                self.numeric[c] = self._sorted(col.to_numpy(dtype=float))
+            else:
+                codes, uniques = pd.factorize(col.astype(str), sort=True)
+                self.values[c] = {v: pack(codes == i) for i, v in enumerate(uniques)}
+        self.numeric["score"] = self._sorted(np.asarray(scores, dtype=float))
+
+        labels = np.asarray(labels, dtype=bool)
+        self.all_rows = pack(np.ones(self.n_rows, dtype=bool))
+        self.pos  = pack(labels)
+        self.neg  = pack(~labels)
+        self._groups = OrderedDict()            # (keys, support) → group bitmaps [G, words], LRU
+        self._pred   = OrderedDict()            # thr → bitmap of score >= thr, LRU
+        self._lock   = threading.Lock()
+
+    @staticmethod
+    def _sorted(values):
+        order = np.argsort(values, kind="stable")
+        return values, values[order], order
+
+    @property
+    def nbytes(self):
+        return int(sum(v.nbytes + s.nbytes + o.nbytes for v, s, o in self.numeric.values())
+                   + sum(b.nbytes for maps in self.values.values() for b in maps.values())
+                   + sum(g.nbytes for g in list(self._groups.values())))
+
+    def _rows(self, column, lo=None, hi=None):
+        """Bitmap of rows with lo <= column <= hi (either bound may be open)."""
+        values, ordered, order = self.numeric[column]
+        lo = -np.inf if lo is None else lo
+        hi = np.inf if hi is None else hi
+        i, j = np.searchsorted(ordered, lo, side="left"), np.searchsorted(ordered, hi, side="right")
+        if j - i > SCATTER_MAX * self.n_rows:
+            if np.isinf(hi):
+                return pack(values >= lo)
+            return pack(values <= hi) if np.isinf(lo) else pack((values >= lo) & (values <= hi))
+        mask = np.zeros(self.n_rows, dtype=bool)
+        mask[order[i:j]] = True
+        return pack(mask)
+
+    def mask(self, filters):
+        """
+        Packed bitmap of the rows matching every entry of `filters`:
+          numeric column     → {"min": lo, "max": hi} or [lo, hi] (null = open)
+          categorical column → list of values (any of them)
+        ValueError for a non-object `filters`, unknown columns or malformed entries.
+        """
+        if filters is None:
+            filters = {}
+        if not isinstance(filters, dict):
+            raise ValueError("filter must be an object mapping column -> range or values")
+        bits = self.all_rows
+        for col, spec in filters.items():
+            if col in self.numeric:
+                if isinstance(spec, dict) and set(spec) <= {"min", "max"}:
+                    lo, hi = spec.get("min"), spec.get("max")
+                elif isinstance(spec, (list, tuple)) and len(spec) == 2:
+                    lo, hi = spec
+                else:
+                    raise ValueError(f"'{col}' needs a range: {{\"min\": lo, \"max\": hi}} or [lo, hi]")
+                bits = bits & self._rows(col, _bound(col, lo), _bound(col, hi))
+            elif col in self.values:
+                if not isinstance(spec, (list, tuple)):
+                    raise ValueError(f"'{col}' needs a list of values")
+                maps = self.values[col]
+                any_of = np.zeros_like(bits)
+                for v in spec:
+                    if str(v) in maps:
+                        any_of |= maps[str(v)]
+                bits = bits & any_of
+            else:
+                raise ValueError(f"unknown column '{col}'")
+        return bits
+
+    def group_bitmaps(self, key, grouping):
+        """One bitmap per group of `grouping`, cached under `key` (the GROUP_CACHE most recent)."""
+        with self._lock:
+            groups = self._groups.pop(key, None)
+        if groups is None:
+            codes = np.asarray(grouping.codes)
+            groups = (np.stack([pack(codes == g) for g in range(grouping.n_groups)])
+                      if grouping.n_groups else np.zeros((0, len(self.all_rows)), dtype=np.uint64))
+        with self._lock:
+            self._groups[key] = groups
+            while len(self._groups) > GROUP_CACHE:
+                self._groups.popitem(last=False)
+        return groups
+
+    def counts(self, bits, groups, thr):
+        """(tp, fp, tn, fn) per group row of `groups` for the rows in `bits`, pred = score >= thr."""
+        with self._lock:
+            pred = self._pred.pop(thr, None)
+        if pred is None:
+            pred = self._rows("score", lo=thr)
+        with self._lock:
+            self._pred[thr] = pred
+            while len(self._pred) > PRED_CACHE:
+                self._pred.popitem(last=False)
+        rows = groups & bits                                    # [G, words]
+        return (popcount(rows & (self.pos & pred)), popcount(rows & (self.neg & pred)),
+                popcount(rows & (self.neg & ~pred)), popcount(rows & (self.pos & ~pred)))
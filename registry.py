@@ -0,0 +1,422 @@
+"""
+Dataset / model registry.
+
+Each (dataset, model) pair is loaded lazily from its artifact on first use
+and kept in an LRU; once the loaded entries together go over the memory
+budget the least recently used ones are dropped (they reload on demand).
+"""
+import itertools
+import json
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import artifacts
+from fairness import ThresholdSweep, confusion_counts
+from groups import EAGER_ARITY, PRUNED_VIEWS
+from query import RowIndex
+from rescoring import Rescorer
+from slices import SliceIndex
+from streaming import HistogramSweep, StreamingStats
+
+
+def _combinations(protected_attrs):
+    """Every protected key combination GroupIndex builds eagerly (including none)."""
+    keys = list(protected_attrs)
+    return [c for r in range(min(len(keys), EAGER_ARITY) + 1)
+            for c in itertools.combinations(keys, r)]
+
+
+def _cached_sweep(entry, keys, support, build):
+    """
+    entry's sweep for protected `keys` under canonical `support`: unpruned
+    ones are kept for good (warm() builds them), pruned ones in an LRU of
+    PRUNED_VIEWS so arbitrary ?min_support= values cannot grow the entry.
+    """
+    if support is None:
+        if keys not in entry._sweeps:
+            entry._sweeps[keys] = build()
+        return entry._sweeps[keys]
+    with entry._lock:
+        sweep = entry._pruned.pop((keys, support), None)
+    if sweep is None:
+        sweep = build()
+    with entry._lock:
+        entry._pruned[keys, support] = sweep
+        while len(entry._pruned) > PRUNED_VIEWS:
+            entry._pruned.popitem(last=False)
+    return sweep
+
+
+class ModelEntry:
+    """Evaluation state for one (dataset, model): test split, scores, group index."""
+
+    streaming = False
+
+    def __init__(self, dataset, model, spec, artifact):
+        self.dataset  = dataset
+        self.model    = model
+        self.key      = (dataset, model)
+        self.version  = artifact.path.name          # content hash of CSV + config
+        self.artifact = artifact
+
+        self.target          = spec["target"]
+        self.protected_attrs = spec["protected"]
+
+        self.X_test = artifact.X_test
+        self.feature_names = list(self.X_test.columns)
+        self.y_test = pd.Series(artifact.y_test, name=self.target)
+        self.y_prob = artifact.y_prob
+        self.n_rows = len(self.y_prob)
+        self.groups = artifact.groups               # GroupIndex
+
+        self._sweeps = {}                           # protected keys → sweep
+        self._pruned = OrderedDict()                # (keys, support) → sweep over pruned cells, LRU
+        self._lock   = threading.Lock()
+        self._fbins  = {}                           # (feature, bins) → (codes, labels)
+        self._slices = {}                           # bins → SliceIndex
+        self._rescorer = None
+        self._row_index = None
+        self._base_bytes = int(
+            self.X_test.memory_usage(deep=True).sum()
+            + self.y_prob.nbytes + self.y_test.values.nbytes
+            + sum(g.codes.nbytes for g in self.groups._combos.values())
+        )
+
+    @property
+    def clf(self):
+        """Fitted Pipeline, unpickled on first use."""
+        return self.artifact.model
+
+    @property
+    def rescorer(self):
+        """Rescorer for /repredict deltas, built on first use."""
+        if self._rescorer is None:
+            self._rescorer = Rescorer(self.clf, self.X_test, self.y_prob)
+        return self._rescorer
+
+    @property
+    def row_index(self):
+        """RowIndex (sorted numeric columns, per-value bitmaps) for /query, built on first use."""
+        if self._row_index is None:
+            self._row_index = RowIndex(self.X_test, self.y_prob, self.y_test.values)
+        return self._row_index
+
+    def sweep_for(self, protected_cols, support=None):
+        """
+        Return (grouping, sweep) for a protected grouping:
+          grouping – GroupIndex entry (codes, labels, display order, …)
+          sweep    – ThresholdSweep over y_prob / y_test, built once per partition
+        `support` = (min_support, merge) prunes small cells first (GroupIndex.grouping).
+        """
+        support = self.groups.support_key(protected_cols, support)
+        grouping = self.groups.grouping(protected_cols, support)
+        build = lambda: ThresholdSweep(self.y_prob, self.y_test.values,
+                                       grouping.codes, grouping.n_groups)
+        return grouping, _cached_sweep(self, frozenset(protected_cols), support, build)
+
+    def feature_bins(self, feature, bins):
+        """(bin code per test row, ordered bin labels) for a heatmap feature, cached per (feature, bins)."""
+        key = (feature, bins)
+        if key in self._fbins:
+            return self._fbins[key]
+
+        feat = self.X_test[feature]
+        if pd.api.types.is_numeric_dtype(feat):
+
+            # equal-population edges, duplicates collapsed
+            edges  = np.unique(
+                np.quantile(feat, np.linspace(0, 1, bins + 1))
+            )
+            labels = [f"{int(edges[i])}–{int(edges[i+1])}"
+                    for i in range(len(edges) - 1)]
+
+            fbin = pd.cut(
+                feat,
+                bins=edges,
+                labels=labels,
+                include_lowest=True,
+                duplicates="drop"
+            )
+            fcodes, flabels = fbin.cat.codes.to_numpy(), list(fbin.cat.categories)
+        else:
+            fcodes, flabels = pd.factorize(feat.astype(str), sort=True)
+            flabels = list(flabels)
+
+        self._fbins[key] = (fcodes.astype(np.int64), flabels)
+        return self._fbins[key]
+
+    def slice_index(self, bins):
+        """Bitmap per (feature, value/bin) literal for slice discovery, cached per bins."""
+        if bins not in self._slices:
+            binned = [self.feature_bins(f, bins) for f in self.feature_names]
+            self._slices[bins] = SliceIndex(self.feature_names, *zip(*binned))
+        return self._slices[bins]
+
+    def heatmap_cells(self, feature, bins, protected_cols, thr, support=None):
+        """
+        Confusion cells per (protected group, feature bin), from one bincount
+        over the combined (group, bin) code.
+        Returns (grouping, bin labels, tp, fp, tn, fn) with cells shaped (groups, bins).
+        """
+        fcodes, flabels = self.feature_bins(feature, bins)
+        grouping = self.groups.grouping(protected_cols, support)
+        pcodes = grouping.codes
+
+        n_p, n_f = grouping.n_groups, len(flabels)
+        cell = np.where((pcodes >= 0) & (fcodes >= 0), pcodes * n_f + fcodes, -1)
+        cells = confusion_counts(cell, n_p * n_f, self.y_test.values,
+                                 (self.y_prob >= thr).astype(int))
+        return (grouping, flabels, *(c.reshape(n_p, n_f) for c in cells))
+
+    def warm(self, bins=6):
+        """
+        Build the lazily derived state up front – sweeps for every eagerly
+        indexed protected combination, heatmap bins, the rescorer, the
+        /query row index – so a pre-fork parent can hand it to its workers
+        (see serve.py).
+        """
+        for combo in _combinations(self.protected_attrs):
+            self.sweep_for(list(combo))
+        for f in self.feature_names:
+            self.feature_bins(f, bins)
+        self.rescorer
+        self.row_index
+        return self
+
+    @property
+    def nbytes(self):
+        """Rough resident size, used for the registry's memory budget."""
+        extra = self._rescorer.logit.nbytes if self._rescorer and self._rescorer.linear else 0
+        extra += sum(codes.nbytes for codes, _ in self._fbins.values())
+        extra += sum(index.nbytes for index in self._slices.values())
+        extra += self._row_index.nbytes if self._row_index else 0
+        extra += self.groups.pruned_nbytes
+        with self._lock:
+            sweeps = [*self._sweeps.values(), *self._pruned.values()]
+        return self._base_bytes + extra + sum(sw.scores.nbytes + sw.cum_pos.nbytes for sw in sweeps)
+
+
+class StreamingEntry:
+    """
+    Same query surface as ModelEntry for an evaluation file scored out of
+    core: everything is answered from StreamingStats aggregates, and
+    row-level endpoints (PCP, repredict) are not available.
+    """
+
+    streaming = True
+
+    def __init__(self, dataset, model, spec, artifact, stats, version):
+        self.dataset  = dataset
+        self.model    = model
+        self.key      = (dataset, model)
+        self.version  = version
+        self.artifact = artifact
+
+        self.target          = spec["target"]
+        self.protected_attrs = spec["protected"]
+        self.feature_names   = stats.features
+        self.stats  = stats
+        self.groups = stats.group_index()        # GroupIndex over protected cells
+        self.n_rows = stats.n_rows
+        self._sweeps = {}                        # protected keys → sweep
+        self._pruned = OrderedDict()             # (keys, support) → sweep over pruned cells, LRU
+        self._lock   = threading.Lock()
+        self._fbins  = {}                        # (feature, bins) → (level → bin, labels)
+
+    @property
+    def clf(self):
+        return self.artifact.model
+
+    def _group_sum(self, grouping, arr):
+        """Sum a per-cell array into per-group rows."""
+        codes = np.asarray(grouping.codes)
+        out = np.zeros((grouping.n_groups,) + arr.shape[1:], dtype=arr.dtype)
+        np.add.at(out, codes[codes >= 0], arr[codes >= 0])
+        return out
+
+    def sweep_for(self, protected_cols, support=None):
+        support = self.groups.support_key(protected_cols, support)
+        grouping = self.groups.grouping(protected_cols, support)
+        build = lambda: HistogramSweep(self._group_sum(grouping, self.stats.conf))
+        return grouping, _cached_sweep(self, frozenset(protected_cols), support, build)
+
+    def heatmap_cells(self, feature, bins, protected_cols, thr, support=None):
+        grouping = self.groups.grouping(protected_cols, support)
+        if (feature, bins) not in self._fbins:
+            self._fbins[feature, bins] = self.stats.heatmap_levels(feature, bins)
+        remap, flabels = self._fbins[feature, bins]
+
+        hist = self._group_sum(grouping, self.stats.feat_hist[feature])   # [g, level, label, bin]
+        binned = np.zeros((grouping.n_groups, len(flabels)) + hist.shape[2:], dtype=hist.dtype)
+        np.add.at(binned, (slice(None), remap), hist)                      # levels → bins
+
+        n_p, n_f = binned.shape[:2]
+        sweep = HistogramSweep(binned.reshape(n_p * n_f, *binned.shape[2:]))
+        return (grouping, flabels, *(c.reshape(n_p, n_f) for c in sweep.counts(thr)))
+
+    def warm(self, bins=6):
+        for combo in _combinations(self.protected_attrs):
+            self.sweep_for(list(combo))
+        for f in self.feature_names:
+            if (f, bins) not in self._fbins:
+                self._fbins[f, bins] = self.stats.heatmap_levels(f, bins)
+        return self
+
+    @property
+    def nbytes(self):
+        with self._lock:
+            sweeps = [*self._sweeps.values(), *self._pruned.values()]
+        return int(self.stats.conf.nbytes + sum(h.nbytes for h in self.stats.feat_hist.values())
+                   + self.groups.pruned_nbytes + sum(sw.above.nbytes for sw in sweeps))
+
+
+class Registry:
+    """Named datasets, each with one or more model configs."""
+
+    def __init__(self, memory_budget=2 * 2**30, on_load=None):
+        self.memory_budget = memory_budget
+        self.on_load = on_load                 # callback(entry) after each load
+        self.specs   = {}                      # dataset → spec dict
+        self._loaded = OrderedDict()           # (dataset, model) → ModelEntry, LRU order
+        self._locks  = {}
+        self._lock   = threading.Lock()
+        self.default = None
+
+    def register(self, dataset, csv, target, protected, models, positive=1,
+                 eval_path=None, chunksize=200_000):
+        """
+        Add a dataset spec; the first one registered becomes the default.
+        With `eval_path` the models are trained on `csv` but evaluated by
+        streaming `eval_path` in chunks (for audit sets larger than RAM).
+        """
+        self.specs[dataset] = {
+            "csv": Path(csv), "target": target, "positive": positive,
+            "protected": dict(protected), "models": dict(models),
+            "eval_path": eval_path, "chunksize": chunksize,
+        }
+        if self.default is None:
+            self.default = (dataset, next(iter(models)))
+
+    def load_config(self, path):
+        """Register every dataset in a JSON file shaped like
+        {"name": {"csv": ..., "target": ..., "protected": {...}, "models": {...}}}."""
+        for name, spec in json.loads(Path(path).read_text()).items():
+            self.register(name, spec["csv"], spec["target"], spec["protected"],
+                          spec["models"], spec.get("positive", 1),
+                          spec.get("eval_path"), spec.get("chunksize", 200_000))
+
+    def resolve(self, dataset=None, model=None):
+        """(dataset, model) with defaults filled in; KeyError if unknown."""
+        dataset = dataset or self.default[0]
+        if dataset not in self.specs:
+            raise KeyError(f"unknown dataset '{dataset}'")
+        models = self.specs[dataset]["models"]
+        model = model or (self.default[1] if dataset == self.default[0] else next(iter(models)))
+        if model not in models:
+            raise KeyError(f"unknown model '{model}' for dataset '{dataset}'")
+        return dataset, model
+
+    def get(self, dataset=None, model=None) -> ModelEntry:
+        key = self.resolve(dataset, model)
+        with self._lock:
+            entry = self._loaded.get(key)
+            if entry is not None:
+                self._loaded.move_to_end(key)
+                return entry
+            key_lock = self._locks.setdefault(key, threading.Lock())
+
+        with key_lock:                          # one loader per key, others wait
+            with self._lock:
+                entry = self._loaded.get(key)
+            if entry is None:
+                entry = self._load(*key)
+                with self._lock:
+                    self._loaded[key] = entry
+                    self._evict(keep=key)
+        return entry
+
+    def _load(self, dataset, model, force=False, spec=None):
+        spec = spec or self.specs[dataset]
+        art = artifacts.load_or_build(spec["csv"], spec["target"], spec["models"][model],
+                                      spec["protected"], spec["positive"], force=force)
+        if spec.get("eval_path"):
+            entry = self._load_streaming(dataset, model, spec, art, force)
+        else:
+            entry = ModelEntry(dataset, model, spec, art)
+        if self.on_load:
+            self.on_load(entry)
+        return entry
+
+    def _load_streaming(self, dataset, model, spec, art, force):
+        """Aggregate spec['eval_path'] in chunks, cached next to the model artifact."""
+        digest  = artifacts._file_digest(Path(spec["eval_path"]))
+        version = f"{art.path.name}-{digest}"
+        cached  = art.path / f"stream-{digest}.pkl"
+        if cached.exists() and not force:
+            stats = StreamingStats.load(cached)
+        else:
+            X_test = art.X_test
+            numeric = X_test.select_dtypes(include=[np.number]).columns.tolist()
+            stats = StreamingStats.build(spec["eval_path"], art.model, spec["target"], spec["positive"],
+                                         spec["protected"], list(X_test.columns), numeric,
+                                         chunksize=spec.get("chunksize", 200_000))
+            stats.save(cached)
+        return StreamingEntry(dataset, model, spec, art, stats, version)
+
+    def reload(self, dataset=None, model=None, force=False) -> ModelEntry:
+        """Rebuild (force) or re-read an entry and swap it in."""
+        key = self.resolve(dataset, model)
+        entry = self._load(*key, force=force)
+        with self._lock:
+            self._loaded[key] = entry
+            self._loaded.move_to_end(key)
+            self._evict(keep=key)
+        return entry
+
+    def swap(self, dataset, model, params, bins=6):
+        """
+        Point (dataset, model) at new model params: load and warm the entry
+        for them (building the artifact if needed), then replace the old entry
+        in one step. Requests already holding the old entry finish on it.
+        """
+        key = self.resolve(dataset, model)
+        spec = dict(self.specs[key[0]])
+        spec["models"] = {**spec["models"], key[1]: params}
+        entry = self._load(*key, spec=spec).warm(bins)
+        with self._lock:
+            self.specs[key[0]] = spec
+            self._loaded[key] = entry
+            self._loaded.move_to_end(key)
+            self._evict(keep=key)
+        return entry
+
+    def _evict(self, keep):
+        """Drop LRU entries (never `keep`) while over the memory budget. Caller holds the lock."""
+        total = sum(e.nbytes for e in self._loaded.values())
+        for key in list(self._loaded):
+            if total <= self.memory_budget:
+                break
+            if key == keep:
+                continue
+            total -= self._loaded.pop(key).nbytes
+
+    def warm(self, bins=6):
+        """Load and warm every registered (dataset, model) that fits the memory budget."""
+        for name, spec in self.specs.items():
+            for model in spec["models"]:
+                self.get(name, model).warm(bins)
+                with self._lock:
+                    self._evict(keep=(name, model))
+
+    def status(self):
+        with self._lock:
+            loaded = {k: e.nbytes for k, e in self._loaded.items()}
+        return [
+            {"dataset": name, "model": m, "loaded": (name, m) in loaded,
+             "bytes": loaded.get((name, m), 0), "default": (name, m) == self.default}
+            for name, spec in self.specs.items() for m in spec["models"]
+        ]
@@ -0,0 +1,143 @@
+"""
+Re-scoring of the test split after some feature values change.
+
+/repredict receives a delta – row ids plus new values for a few columns –
+instead of the whole table. For the OneHotEncoder + LogisticRegression
+pipeline every input column contributes an additive term to the logit, so
+a change only needs that column's coefficient difference:
+
+    logit' = logit + Σ_changed [term_c(new) − term_c(old)]
+
+  * one-hot column  → term_c(v) = coef of the v indicator (0 if unseen)
+  * passthrough     → term_c(v) = coef_c · v
+
+Pipelines that don't fit that shape fall back to predict_proba on the
+affected rows only, in batches.
+"""
+import numpy as np
+import pandas as pd
+
+BATCH_ROWS = 50_000
+
+
+def _expit(z):
+    return 1.0 / (1.0 + np.exp(-z))
+
+
+def _linear_terms(clf, columns):
+    """
+    {column: ("cat", {value: coef}) | ("num", coef)} for a linear pipeline,
+    or None if the pipeline isn't a ColumnTransformer of one-hot/passthrough
+    parts feeding a binary linear model.
+    """
+    from sklearn.compose import ColumnTransformer
+    from sklearn.pipeline import Pipeline
+    from sklearn.preprocessing import FunctionTransformer, OneHotEncoder
+
+    if not isinstance(clf, Pipeline) or len(clf.steps) != 2:
+        return None
+    prep, model = clf.steps[0][1], clf.steps[1][1]
+    coef = getattr(model, "coef_", None)
+    if not isinstance(prep, ColumnTransformer) or coef is None or coef.shape[0] != 1:
+        return None
+    coef = coef[0]
+
+    terms = {}
+    for name, trans, cols in prep.transformers_:
+        if trans == "drop":
+            continue
+        cols = [columns[c] if isinstance(c, (int, np.integer)) else c for c in np.atleast_1d(cols)]
+        out = prep.output_indices_[name]
+        w = coef[out]
+        if isinstance(trans, OneHotEncoder):
+            if trans.drop is not None or trans.min_frequency is not None or trans.max_categories is not None:
+                return None
+            start = 0
+            for col, cats in zip(cols, trans.categories_):
+                terms[col] = ("cat", dict(zip(cats, w[start:start + len(cats)])))
+                start += len(cats)
+        elif trans == "passthrough" or (isinstance(trans, FunctionTransformer) and trans.func is None):
+            for col, c in zip(cols, w):
+                terms[col] = ("num", float(c))
+        else:
+            return None
+    return terms
+
+
+def _row_ids(ids, n_rows):
+    """`ids` as an int64 array; ValueError unless every id is an integer in [0, n_rows)."""
+    arr = np.asarray(ids)
+    if arr.dtype.kind == "f" and np.isfinite(arr).all() and (arr == np.floor(arr)).all():
+        arr = arr.astype(np.int64)
+    if arr.ndim != 1 or arr.dtype.kind not in "iu":
+        raise ValueError("ids must be a list of integer row ids")
+    if arr.size and (arr.min() < 0 or arr.max() >= n_rows):
+        raise ValueError("row id out of range")
+    return arr.astype(np.int64)
+
+
+def _has_missing(values):
+    """True if any value is None/NaN or ±inf."""
+    arr = np.asarray(values)
+    if arr.dtype.kind == "f":
+        return not np.isfinite(arr).all()
+    if arr.dtype.kind == "O":
+        return bool(pd.isna(arr).any() or pd.Series(arr).isin([np.inf, -np.inf]).any())
+    return False
+
+
+class Rescorer:
+    """Delta re-scoring for one model over its test split."""
+
+    def __init__(self, clf, X_test, y_prob):
+        self.clf    = clf
+        self.X_test = X_test
+        self.terms  = _linear_terms(clf, list(X_test.columns))
+        # base logits, recovered from the stored probabilities
+        self.logit  = None if self.terms is None else np.log(y_prob) - np.log1p(-np.asarray(y_prob))
+
+    @property
+    def linear(self):
+        return self.terms is not None
+
+    def _term(self, col, values):
+        kind, w = self.terms[col]
+        if kind == "num":
+            try:
+                return w * pd.to_numeric(pd.Series(values), errors="raise").to_numpy(dtype=float)
+            except (TypeError, ValueError):
+                raise ValueError(f"'{col}' needs numeric values") from None
+        return pd.Series(values, dtype=object).map(w).fillna(0.0).to_numpy(dtype=float)
+
+    def rescore(self, ids, changes):
+        """
+        Scores for rows `ids` once each column in `changes` ({column: values
+        aligned with ids}) takes its new values; other columns keep their
+        test-split values.
+        """
+        ids = _row_ids(ids, len(self.X_test))
+        unknown = [c for c in changes if c not in self.X_test.columns]
+        if unknown:
+            raise ValueError(f"unknown columns: {', '.join(map(str, unknown))}")
+        for col, values in changes.items():
+            if isinstance(values, (str, dict)) or np.ndim(values) != 1:
+                raise ValueError(f"'{col}' needs a list of values")
+            if len(values) != len(ids):
+                raise ValueError(f"'{col}' has {len(values)} values for {len(ids)} ids")
+            if _has_missing(values):
+                raise ValueError(f"'{col}' has missing or non-finite values")
+
+        if self.linear:
+            z = self.logit[ids].copy()
+            for col, values in changes.items():
+                z += self._term(col, values) - self._term(col, self.X_test[col].to_numpy()[ids])
+            return _expit(z)
+
+        out = np.empty(len(ids))
+        for lo in range(0, len(ids), BATCH_ROWS):
+            part = ids[lo:lo + BATCH_ROWS]
+            X = self.X_test.iloc[part].reset_index(drop=True)
+            for col, values in changes.items():
+                X[col] = list(values[lo:lo + BATCH_ROWS])
+            out[lo:lo + len(part)] = self.clf.predict_proba(X)[:, 1]
+        return out
@@ -0,0 +1,117 @@
+"""
+Pre-fork production server.
+
+    python serve.py --workers 8 --port 8000
+
+The parent imports the app, builds or memory-maps every registered
+(dataset, model) artifact and warms the derived state (threshold sweeps
+for each protected combination, heatmap bins, the rescorer), then forks
+the workers. Scores, labels and group codes are read-only np.load mmaps
+of the artifact files, so every worker reads the same page-cache pages;
+whatever the parent computed is inherited copy-on-write and never written
+again. gc.freeze() moves those objects out of the collector's reach so
+garbage collection in a worker doesn't dirty (and so copy) their pages.
+
+All workers accept on the one listening socket the parent opened, each
+with a threaded WSGI server. The parent restarts workers that die and
+stops them all on SIGTERM / SIGINT. Response caches and /metrics counters
+are per worker; retrain jobs and swaps are shared through JOB_DIR (see jobs.py).
+"""
+import contextlib
+import gc
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+import traceback
+
+import click
+from werkzeug.serving import make_server
+
+RESPAWN_BACKOFF = 1.0           # seconds to wait before replacing a worker that died young
+
+
+def _worker(app, sock, host, port):
+    server = make_server(host, port, app, threaded=True, fd=sock.fileno())
+    signal.signal(signal.SIGTERM, lambda *_: threading.Thread(target=server.shutdown).start())
+    server.serve_forever()
+
+
+def _spawn(app, sock, host, port):
+    pid = os.fork()
+    if pid:
+        return pid
+    # drop the parent's handlers first; the parent stops workers with SIGTERM
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    code = 0
+    try:
+        _worker(app, sock, host, port)
+    except BaseException:
+        traceback.print_exc()
+        code = 1
+    finally:
+        os._exit(code)
+
+
+def serve(app, host="127.0.0.1", port=8000, workers=None, backlog=1024):
+    """Fork `workers` processes serving `app` on host:port until SIGTERM / SIGINT."""
+    workers = workers or os.cpu_count() or 1
+    sock = socket.create_server((host, port), backlog=backlog)
+    sock.set_inheritable(True)
+
+    gc.collect()
+    gc.freeze()
+
+    children = {}                                           # pid → start time
+    stopping = False
+
+    def stop(*_):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            with contextlib.suppress(ProcessLookupError):
+                os.kill(pid, signal.SIGTERM)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    for _ in range(workers):
+        children[_spawn(app, sock, host, port)] = time.monotonic()
+    print(f"serving on http://{host}:{port} with {workers} workers", flush=True)
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        started = children.pop(pid, None)
+        if stopping or started is None:
+            continue
+        print(f"worker {pid} exited ({os.waitstatus_to_exitcode(status)}), restarting",
+              file=sys.stderr, flush=True)
+        if time.monotonic() - started < RESPAWN_BACKOFF:
+            time.sleep(RESPAWN_BACKOFF)
+        children[_spawn(app, sock, host, port)] = time.monotonic()
+    sock.close()
+
+
+@click.command()
+@click.option("--host", default="127.0.0.1")
+@click.option("--port", default=8000)
+@click.option("--workers", default=None, type=int, help="worker processes (default: CPU count)")
+@click.option("--bins", default=6, help="heatmap bin count to precompute")
+def main(host, port, workers, bins):
+    """Load and warm every registered dataset once, then fork the workers."""
+    t0 = time.perf_counter()
+    import app
+    app.REGISTRY.warm(bins)
+    loaded = sum(s["loaded"] for s in app.REGISTRY.status())
+    print(f"warmed {loaded} model(s) in {time.perf_counter() - t0:.1f}s", flush=True)
+    serve(app.app, host, port, workers)
+
+
+if __name__ == "__main__":
+    main()
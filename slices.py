@@ -0,0 +1,167 @@
+"""
+Worst-slice discovery over conjunctions of feature values.
+
+A slice is a conjunction of literals such as Purpose=A43 ∧ Housing=A152
+(numeric features contribute their /heatmap bins). Every literal is kept
+as a packed row bitmap, so a slice's rows are the AND of its literals'
+bitmaps, and its confusion counts are popcounts against the TP/FP/TN/FN
+bitmaps at the requested threshold.
+
+The search walks the lattice level by level, apriori style: a slice is
+only extended with literals of later features, and slices below
+`min_support` are never extended (support can only shrink), nor are
+literals that keep every row of their parent. Slices are
+ranked by a support-weighted effect size,
+
+    score = |m_slice − m_rest| · sqrt(n_slice · n_rest / (n_slice + n_rest))
+
+with n the rows each side of the metric is defined over, i.e. the
+numerator of a two-sample z statistic. Parents are expanded in chunks,
+over the shared process pool (procpool) once a level has many candidates.
+"""
+import heapq
+import os
+
+import numpy as np
+
+from fairness import metric_from_counts, metric_support
+from procpool import pmap
+
+CHUNK        = 256              # parent slices per task
+PARALLEL_MIN = 200_000          # candidates per level below which a pool costs more than it saves
+
+if hasattr(np, "bitwise_count"):
+    def popcount(words):
+        return np.bitwise_count(words).sum(axis=-1, dtype=np.int64)
+else:                                                   # numpy < 2.0
+    _POP8 = np.array([bin(i).count("1") for i in range(256)], dtype=np.int64)
+
+    def popcount(words):
+        return _POP8[words.view(np.uint8)].sum(axis=-1)
+
+
+def pack(mask):
+    """Boolean row mask → packed uint64 words."""
+    bits = np.packbits(np.asarray(mask, dtype=bool), bitorder="little")
+    bits = np.pad(bits, (0, -len(bits) % 8))
+    return bits.view(np.uint64)
+
+
+class SliceIndex:
+    """Packed bitmap per (feature, value) literal."""
+
+    def __init__(self, features, codes, labels):
+        """features[i] has row codes codes[i] (−1 = missing) and value labels labels[i]."""
+        self.features = list(features)
+        self.lit_feature, self.lit_label, maps = [], [], []
+        for f, (fc, fl) in enumerate(zip(codes, labels)):
+            for v, label in enumerate(fl):
+                self.lit_feature.append(f)
+                self.lit_label.append(str(label))
+                maps.append(pack(fc == v))
+        self.lit_feature = np.asarray(self.lit_feature, dtype=np.int64)
+        self.bitmaps = np.stack(maps) if maps else np.zeros((0, 0), dtype=np.uint64)
+
+    @property
+    def nbytes(self):
+        return self.bitmaps.nbytes
+
+    def describe(self, lits):
+        return [dict(feature=self.features[self.lit_feature[l]], value=self.lit_label[l])
+                for l in lits]
+
+
+class _Search:
+    """One request's state: literals, outcome bitmaps, totals and pruning limits."""
+
+    def __init__(self, index, labels, pred, metric, min_support, top_k):
+        self.index  = index
+        self.metric = metric
+        self.min_support = min_support
+        self.top_k  = top_k
+        labels, pred = np.asarray(labels, dtype=bool), np.asarray(pred, dtype=bool)
+        # outcome bitmaps in (tp, fp, tn, fn) order
+        self.cells  = np.stack([pack(labels & pred), pack(~labels & pred),
+                                pack(~labels & ~pred), pack(labels & ~pred)])
+        self.totals = popcount(self.cells)
+        self.all_rows = pack(np.ones(len(labels), dtype=bool))
+
+    def score(self, counts):
+        """(metric, rest metric, score) for counts shaped [4, m]."""
+        rest = self.totals[:, None] - counts
+        m_s, m_r = metric_from_counts(self.metric, *counts), metric_from_counts(self.metric, *rest)
+        n_s, n_r = metric_support(self.metric, *counts), metric_support(self.metric, *rest)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            score = np.abs(m_s - m_r) * np.sqrt(n_s * n_r / (n_s + n_r))
+        return m_s, m_r, np.nan_to_num(score, nan=-1.0)
+
+    def expand(self, parents):
+        """
+        Children of each parent (tuple of literal ids, empty = root) with enough
+        support. Returns (children to expand further, top_k scored children).
+        """
+        idx = self.index
+        survivors, best = [], []
+        for parent in parents:
+            start = idx.lit_feature[parent[-1]] + 1 if parent else 0
+            lits = np.flatnonzero(idx.lit_feature >= start)
+            if not lits.size:
+                continue
+            rows = self.all_rows
+            for l in parent:
+                rows = rows & idx.bitmaps[l]
+            maps = idx.bitmaps[lits] & rows
+            support = popcount(maps)
+            # a literal that keeps every row of its parent only renames the same slice
+            ok = (support >= self.min_support) & (support < popcount(rows))
+            if not ok.any():
+                continue
+            lits, maps, support = lits[ok], maps[ok], support[ok]
+            counts = np.stack([popcount(maps & c) for c in self.cells])   # [4, m]
+            m_s, m_r, score = self.score(counts)
+
+            for j in range(len(lits)):
+                child = parent + (int(lits[j]),)
+                survivors.append(child)
+                item = (float(score[j]), child, int(support[j]), float(m_s[j]), float(m_r[j]))
+                if len(best) < self.top_k:
+                    heapq.heappush(best, item)
+                elif item[0] > best[0][0]:
+                    heapq.heapreplace(best, item)
+        return survivors, best
+
+
+def _expand(task):
+    search, chunks = task
+    return [search.expand(parents) for parents in chunks]
+
+
+def worst_slices(index, labels, pred, metric, min_support=30, max_depth=2, top_k=20, workers=None):
+    """
+    (number of slices with enough support, top-k of them by score, best first),
+    searching conjunctions of up to max_depth literals.
+    """
+    search = _Search(index, labels, pred, metric, min_support, top_k)
+    workers = workers or os.cpu_count() or 1
+    best, parents, supported = [], [()], 0
+    for _ in range(max_depth):
+        chunks = [parents[i:i + CHUNK] for i in range(0, len(parents), CHUNK)]
+        width = len(parents) * len(index.lit_feature)              # rough candidate count
+        if workers > 1 and len(chunks) > 1 and width >= PARALLEL_MIN:
+            # one task per worker, each carrying the search and its share of the chunks
+            n = min(workers, len(chunks))
+            parts = pmap(_expand, [(search, chunks[w::n]) for w in range(n)])
+            results = [None] * len(chunks)
+            for w, part in enumerate(parts):
+                results[w::n] = part
+        else:
+            results = [search.expand(c) for c in chunks]
+
+        parents = [s for surv, _ in results for s in surv]
+        supported += len(parents)
+        best = heapq.nlargest(top_k, best + [b for _, top in results for b in top])
+        if not parents:
+            break
+
+    return supported, [dict(slice=index.describe(lits), n=n, metric=m_s, rest=m_r, score=s)
+                      for s, lits, n, m_s, m_r in sorted(best, reverse=True)]
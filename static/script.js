@@ -331,15 +331,53 @@ d3.select("#threshold-slider")
 
 
 /* ========= 5. FETCH + REDRAW ============================= */
+// /pcp_data?format=columnar → row objects; prediction = score >= thr
+function decodeColumnarPcp(pcp, thr) {
+  const cols = pcp.order.map(k => [k, pcp.columns[k]]);
+  const rows = new Array(pcp.length);
+  for (let i = 0; i < pcp.length; i++) {
+    const r = {};
+    for (const [k, c] of cols) {
+      r[k] = c.type === "dict" ? c.dictionary[c.codes[i]] : c.values[i];
+    }
+    r.prediction = (r.score >= thr) ? 1 : 0;
+    rows[i] = r;
+  }
+  return rows;
+}
+
+// Revalidate the columnar /pcp_data against the server (a 304 while the model is
+// unchanged). Its ETag changes with the model, e.g. after a /retrain swap;
+// returns true when new columns were loaded.
+async function loadPcpColumns() {
+  const resp = await fetch(`${API_ROOT}/pcp_data?format=columnar`, { cache: "no-cache" });
+  if (!resp.ok) throw new Error(`pcp_data: HTTP ${resp.status}`);
+  const etag = resp.headers.get("ETag");
+  if (state._columns && etag && etag === state._etag) return false;
+  state._columns = await resp.json();
+  state._etag = etag;
+  return true;
+}
+
 async function updateAll() {
   try {
     const protStr = Array.isArray(currentProtected)
                ? currentProtected.join(",")
                : currentProtected;
     // Load PCP data FIRST (needed for confusion bar computation)
-    if (!state.data.length || state._thr !== currentThr) {
-      const pcp = await d3.json(`${API_ROOT}/pcp_data?thr=${currentThr}`);
-      window.state = { ...pcp, _thr: currentThr };
+    // columns are threshold-independent: re-derive rows on thr change,
+    // rebuild everything when the model behind them changed
+    const columnsChanged = await loadPcpColumns();
+    if (columnsChanged || !state.data.length || state._thr !== currentThr) {
+      const pcp = state._columns;
+      window.state = {
+        data: decodeColumnarPcp(pcp, currentThr),
+        numericKeys: pcp.numericKeys.slice(),
+        catKeys: pcp.catKeys.slice(),
+        _thr: currentThr,
+        _columns: pcp,
+        _etag: state._etag
+      };
       state.data.forEach((d, i) => { if (d._id == null) d._id = i; });
       window.state.numericKeys = window.state.numericKeys.filter(k => !PCP_HIDE.has(k));
       window.state.catKeys     = window.state.catKeys.filter(k => !PCP_HIDE.has(k));
@@ -5609,10 +5647,19 @@ function metricDelta(after, before){
  */
 async function repredictWithNeutralizedFeatures() {
   try {
+    // send only what changed: row ids + the neutralized columns for those rows
+    const changed = state.data.filter(r => r._neutral_features);
+    const feats = [...new Set(changed.flatMap(r => Object.keys(r._neutral_features)))];
+    const changes = {};
+    for (const f of feats) changes[f] = changed.map(r => r[f]);
+
+    for (const r of state.data) r.score_neutral = r.score;
+    if (!changed.length) return;
+
     const response = await fetch("/repredict", {
       method: "POST",
       headers: { "Content-Type": "application/json" },
-      body: JSON.stringify({ rows: state.data })
+      body: JSON.stringify({ ids: changed.map(r => r._id), changes })
     });
 
     if (!response.ok) {
@@ -5620,12 +5667,10 @@ async function repredictWithNeutralizedFeatures() {
     }
 
     const result = await response.json();
-    const newScores = result.scores;
 
-    // Update scores in data
-    for (let i = 0; i < state.data.length && i < newScores.length; i++) {
-      state.data[i].score_neutral = newScores[i];
-    }
+    // Update scores of the changed rows (others keep their original score)
+    const byId = new Map(state.data.map(r => [r._id, r]));
+    result.ids.forEach((id, i) => { byId.get(id).score_neutral = result.scores[i]; });
 
     console.log("Successfully recomputed predictions with neutralized features");
   } catch (error) {
@@ -0,0 +1,219 @@
+"""
+Out-of-core evaluation for audit sets larger than RAM.
+
+The evaluation file is read in chunks (CSV, or Parquet through a memory
+map when pyarrow is installed). Each chunk is scored with the model and
+folded into per-group sufficient statistics, then dropped:
+
+  * score histograms per (protected cell, label)          → /sankey, /metric_gap
+  * the same per (protected cell, feature level, label)   → /heatmap
+
+A protected cell is one combination of protected values (age already
+bucketed), so any protected subset is a sum over cells. Scores are
+binned at 1/score_bins, so confusion counts are exact for thresholds on
+that grid (the dashboard slider steps by 0.01) and other thresholds snap
+up to the next bin edge.
+"""
+import pickle
+
+import numpy as np
+import pandas as pd
+
+from groups import GroupIndex, raw_labels
+
+SCORE_BINS     = 100          # matches the 0.01 slider step
+FEATURE_LEVELS = 32           # quantile levels kept per numeric feature
+MAX_CAT_LEVELS = 256          # categorical values beyond this share one level
+SAMPLE_ROWS    = 200_000      # uniform sample used to place numeric levels
+OTHER          = "(other)"
+
+
+def iter_chunks(path, chunksize, columns=None):
+    """DataFrames of ≤ chunksize rows from a CSV or (memory-mapped) Parquet file."""
+    path = str(path)
+    if path.endswith(".parquet"):
+        import pyarrow.parquet as pq
+        pf = pq.ParquetFile(path, memory_map=True)
+        for batch in pf.iter_batches(batch_size=chunksize, columns=columns):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(path, chunksize=chunksize, usecols=columns)
+
+
+def _grow(arr, n0, n1=None):
+    """Zero-pad the leading axis (and second axis if n1) up to the given sizes."""
+    pad = [(0, max(0, n0 - arr.shape[0]))]
+    pad.append((0, max(0, n1 - arr.shape[1])) if n1 is not None else (0, 0))
+    pad += [(0, 0)] * (arr.ndim - 2)
+    return np.pad(arr, pad) if any(p[1] for p in pad) else arr
+
+
+class HistogramSweep:
+    """ThresholdSweep look-alike over per-group score histograms hist[g, label, bin]."""
+
+    def __init__(self, hist):
+        self.hist  = hist
+        self.edges = np.arange(hist.shape[-1] + 1) / hist.shape[-1]
+        # at-or-above-bin counts: above[g, label, k] = rows with score >= edges[k]
+        self.above = np.concatenate(
+            [np.cumsum(hist[..., ::-1], axis=-1)[..., ::-1],
+             np.zeros(hist.shape[:-1] + (1,), dtype=hist.dtype)], axis=-1)
+        self.size  = hist.sum(axis=(1, 2))
+        self.pos   = hist[:, 1].sum(axis=-1)
+        self.distinct = self.edges
+
+    def _cells(self, k):
+        tp = self.above[:, 1, k]
+        fp = self.above[:, 0, k]
+        return tp, fp, (self.size - self.pos)[:, None] - fp, self.pos[:, None] - tp
+
+    def counts(self, thr):
+        k = np.searchsorted(self.edges, np.atleast_1d(float(thr)), side="left")
+        return tuple(c[:, 0] for c in self._cells(np.minimum(k, len(self.edges) - 1)))
+
+    def curve(self, thresholds=None, max_points=None):
+        thr = self.edges if thresholds is None else np.asarray(thresholds, dtype=float)
+        if max_points and thr.size > max_points:
+            thr = thr[np.unique(np.linspace(0, thr.size - 1, max_points).round().astype(int))]
+        k = np.minimum(np.searchsorted(self.edges, thr, side="left"), len(self.edges) - 1)
+        return (thr, *self._cells(k))
+
+
+class StreamingStats:
+    """Sufficient statistics of one model over one (possibly huge) evaluation file."""
+
+    def __init__(self, protected_attrs, features, numeric, score_bins=SCORE_BINS):
+        self.protected_attrs = dict(protected_attrs)
+        self.features   = list(features)
+        self.numeric    = set(numeric)
+        self.score_bins = score_bins
+        self.n_rows     = 0
+
+        self.cell_ids  = {}                      # tuple of protected values → cell id
+        self.conf      = np.zeros((0, 2, score_bins), dtype=np.int64)
+        self.levels    = {}                      # feature → numeric edges | category list
+        self.feat_hist = {}                      # feature → [cell, level, label, bin]
+
+    # ---------------- building -------------------------------------
+    def fit_levels(self, path, chunksize, seed=0):
+        """Pass 1: place FEATURE_LEVELS quantile edges per numeric feature from a uniform sample."""
+        cols = [c for c in self.features if c in self.numeric]
+        rng = np.random.default_rng(seed)
+        sample, keys = None, np.empty(0)
+        for chunk in iter_chunks(path, chunksize, columns=cols or None):
+            chunk = chunk[cols].to_numpy(dtype=float)
+            k = rng.random(len(chunk))
+            sample = chunk if sample is None else np.vstack([sample, chunk])
+            keys = np.concatenate([keys, k])
+            if len(keys) > SAMPLE_ROWS:                 # keep the smallest random keys
+                keep = np.argpartition(keys, SAMPLE_ROWS)[:SAMPLE_ROWS]
+                sample, keys = sample[keep], keys[keep]
+        for j, c in enumerate(cols):
+            vals = sample[:, j][~np.isnan(sample[:, j])] if sample is not None else np.empty(0)
+            q = np.linspace(0, 1, FEATURE_LEVELS + 1)
+            self.levels[c] = np.unique(np.quantile(vals, q)) if vals.size else np.array([0.0, 0.0])
+        for c in self.features:
+            if c not in self.numeric:
+                self.levels[c] = []
+
+    def _cell_codes(self, chunk):
+        parts = [raw_labels(chunk[col]).to_numpy(dtype=object) for col in self.protected_attrs.values()]
+        keys = pd.MultiIndex.from_arrays(parts) if len(parts) > 1 else pd.Index(parts[0])
+        inv, uniq = pd.factorize(keys)
+        ids = np.empty(len(uniq), dtype=np.int64)
+        for i, u in enumerate(uniq):
+            u = u if isinstance(u, tuple) else (u,)
+            ids[i] = self.cell_ids.setdefault(u, len(self.cell_ids))
+        return ids[inv]
+
+    def _level_codes(self, feature, col):
+        if feature in self.numeric:
+            edges = self.levels[feature]
+            n = max(len(edges) - 1, 1)
+            # right-closed (e_i, e_i+1], first bin includes its left edge – like pd.cut
+            codes = np.searchsorted(edges, col.to_numpy(dtype=float), side="left") - 1
+            return np.clip(codes, 0, n - 1), n
+
+        table = self.levels[feature]
+        lookup = {v: i for i, v in enumerate(table)}
+        inv, uniq = pd.factorize(col.astype(str), use_na_sentinel=False)
+        ids = np.empty(len(uniq), dtype=np.int64)
+        for i, u in enumerate(uniq):
+            u = str(u)
+            if u not in lookup:
+                if len(table) < MAX_CAT_LEVELS:
+                    lookup[u] = len(table); table.append(u)
+                else:
+                    if OTHER not in lookup:
+                        lookup[OTHER] = len(table); table.append(OTHER)
+                    u = OTHER
+            ids[i] = lookup[u]
+        return ids[inv], len(table)
+
+    def add_chunk(self, chunk, labels, scores):
+        """Pass 2: fold one scored chunk into the histograms."""
+        B = self.score_bins
+        edges = np.arange(B + 1) / B
+        sbin  = np.clip(np.searchsorted(edges, scores, side="right") - 1, 0, B - 1)
+        label = np.asarray(labels, dtype=np.int64)
+        cell  = self._cell_codes(chunk)
+        n_cells = len(self.cell_ids)
+        self.n_rows += len(chunk)
+
+        base = (cell * 2 + label) * B + sbin
+        self.conf = _grow(self.conf, n_cells)
+        self.conf += np.bincount(base, minlength=n_cells * 2 * B).reshape(n_cells, 2, B)
+
+        for f in self.features:
+            lvl, n_lvl = self._level_codes(f, chunk[f])
+            hist = _grow(self.feat_hist.get(f, np.zeros((0, 0, 2, B), dtype=np.int64)), n_cells, n_lvl)
+            flat = ((cell * n_lvl + lvl) * 2 + label) * B + sbin
+            hist += np.bincount(flat, minlength=n_cells * n_lvl * 2 * B).reshape(n_cells, n_lvl, 2, B)
+            self.feat_hist[f] = hist
+
+    @classmethod
+    def build(cls, path, clf, target, positive, protected_attrs, features, numeric,
+              chunksize=200_000):
+        stats = cls(protected_attrs, features, numeric)
+        stats.fit_levels(path, chunksize)
+        for chunk in iter_chunks(path, chunksize):
+            labels = (chunk[target] == positive).astype(int).to_numpy()
+            scores = clf.predict_proba(chunk[features])[:, 1]
+            stats.add_chunk(chunk, labels, scores)
+        return stats
+
+    def save(self, path):
+        with open(path, "wb") as fh:
+            pickle.dump(self, fh, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def load(path):
+        with open(path, "rb") as fh:
+            return pickle.load(fh)
+
+    # ---------------- querying -------------------------------------
+    def group_index(self):
+        """GroupIndex over protected cells (one row per cell, weighted by its row count)."""
+        cells = sorted(self.cell_ids, key=self.cell_ids.get)   # first-seen order
+        frame = pd.DataFrame(cells, columns=list(self.protected_attrs.values()))
+        return GroupIndex(frame, self.protected_attrs, weights=self.conf.sum(axis=(1, 2)))
+
+    def heatmap_levels(self, feature, bins):
+        """(level → bin code, bin labels) for a requested number of bins."""
+        if feature not in self.numeric:
+            table = self.levels[feature]
+            order = sorted(range(len(table)), key=table.__getitem__)
+            remap = np.empty(len(table), dtype=np.int64)
+            remap[order] = np.arange(len(table))
+            return remap, [table[i] for i in order]
+
+        edges = self.levels[feature]
+        n_lvl = max(len(edges) - 1, 1)
+        # nearest level edge to each requested quantile (edges ≈ quantiles j / n_lvl)
+        pick = np.unique(np.round(np.linspace(0, 1, bins + 1) * n_lvl).astype(int))
+        chosen = edges[np.minimum(pick, len(edges) - 1)]
+        chosen = np.unique(chosen)
+        labels = [f"{int(chosen[i])}–{int(chosen[i+1])}" for i in range(len(chosen) - 1)] or ["all"]
+        lower = edges[:n_lvl]
+        remap = np.clip(np.searchsorted(chosen, lower, side="right") - 1, 0, len(labels) - 1)
+        return remap, labels
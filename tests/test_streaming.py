@@ -0,0 +1,19 @@
+import numpy as np
+import pandas as pd
+
+from groups import raw_labels
+from streaming import StreamingStats
+
+
+def test_raw_labels_chunk_all_under_30():
+    labels = raw_labels(pd.Series([22, 25, 28], name="Age"))
+    assert labels.tolist() == ["<30", "<30", "<30"]
+
+
+def test_cell_codes_agree_across_chunks():
+    stats = StreamingStats({"age": "Age"}, [], [])
+    young = stats._cell_codes(pd.DataFrame({"Age": [22, 25, 28]}))
+    mixed = stats._cell_codes(pd.DataFrame({"Age": [75, 29, 30]}))
+    assert np.array_equal(young, [0, 0, 0])
+    assert np.array_equal(mixed, [1, 0, 1])
+    assert stats.cell_ids == {("<30",): 0, ("≥30",): 1}